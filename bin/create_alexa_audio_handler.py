@@ -12,8 +12,9 @@ Script will create a concrete implementation of the Alexa Handler.
 
 handler_file_template = """
 from pyalexaskill.AlexaAudioBaseHandler import AlexaAudioBaseHandler
+from pyalexaskill.AlexaPlaylist import Playlist, LOOP_ALL, LOOP_OFF
+from pyalexaskill.AlexaPositionStore import PositionStore
 import logging
-import random
 
 
 class MyAudioException(Exception):
@@ -22,6 +23,11 @@ class MyAudioException(Exception):
 
 class AlexaBwBHandler(AlexaAudioBaseHandler):
 
+    # requests that are answered without dispatching them to an on_ method
+    fast_ack_requests = {
+        "AudioPlayer.PlaybackFinished": None,
+    }
+
     def _build_audio_response(self, speech, title, card):
         session_attributes = {}
         card_title = title
@@ -50,7 +56,12 @@ class AlexaBwBHandler(AlexaAudioBaseHandler):
             'token': ''
         })
         #add more songs here
-        super(AlexaBwBHandler, self).__init__(app_id, log_level)
+        # for large catalogs, build an index once with SQLiteCatalog.build('catalog.db', songs)
+        # and use SQLiteCatalog('catalog.db') instead of Playlist(self.songs)
+        super(AlexaBwBHandler, self).__init__(app_id, log_level, Playlist(self.songs))
+        # keeps the resume positions in the process, pass an AttributeStore
+        # backend to keep them across containers
+        self.position_store = PositionStore()
 
     def on_system_exceptionencountered(self, event, context):
         try:
@@ -67,7 +78,7 @@ class AlexaBwBHandler(AlexaAudioBaseHandler):
         return self.create_empty_response()
 
     def on_startover_intent(self, intent_request, session):
-        return self._play_song()
+        return self._play_song(self.get_queue(session))
 
     def on_stop_intent(self, intent_request, session):
         self.logger.debug("AlexaBwBHandler.on_stop_intent")
@@ -95,35 +106,36 @@ class AlexaBwBHandler(AlexaAudioBaseHandler):
 
     def on_launchrequest(self, event, context):
         self.logger.debug("Executing on_launch")
-        return self._play_song()
+        return self._play_song(self.get_queue())
 
     def _enqueue_song(self, current_token):
-        song = random.choice(self.songs)
-        url = song['url']
-        token = song['token']
+        queue = self.get_queue(token=current_token)
+        song = queue.next(automatic=True)
+        if song is None:
+            # end of the playlist
+            return None
         self.logger.debug("_enqueue_song: {0}".format(song['name']))
-        enqueue_response = self.create_enqueue_directive(current_token, token, url)
+        enqueue_response = self.create_queue_enqueue_directive(queue, current_token)
         self.logger.debug("Enqueue Response: {0}".format(enqueue_response))
         return enqueue_response
 
-    def _play_song(self, silent=False):
-        song = random.choice(self.songs)
-        url = song['url']
-        token = song['token']
+    def _play_song(self, queue, silent=False, offset=0):
+        song = queue.current()
         if silent:
             speech = ""
         else:
             speech = "Playing {0}".format(song['name'])
         card = "Playing {0}".format(song['name'])
         self.logger.debug("_play_song: {0}".format(song['name']))
-        session_attributes = {
-            'song': song
-        }
 
-        play_response = self.create_play_directive(token, url, "REPLACE_ALL", 0, speech, "BwB", card, session_attributes)
+        play_response = self.create_queue_play_directive(queue, "REPLACE_ALL", offset, speech, "BwB", card)
         self.logger.debug("Play Response: {0}".format(play_response))
         return play_response
 
+    def _continue_song(self, queue, session):
+        # play the current song on from where it is, with the new state of the queue in its token
+        return self._play_song(queue, silent=True, offset=self.get_audio_player_offset(session))
+
     def on_help_intent(self, intent_request, session):
         session_attributes = {}
         card_output = "You can hear the sizzling sounds of Better with Bacon by saying, play some bacon"
@@ -141,7 +153,10 @@ class AlexaBwBHandler(AlexaAudioBaseHandler):
         return self._build_response(session_attributes, speechlet)
 
     def on_next_intent(self, intent_request, session):
-        return self._play_song()
+        queue = self.get_queue(session)
+        if queue.next() is None:
+            return self._build_audio_response("That was the last song", "BwB", "That was the last song")
+        return self._play_song(queue)
 
     def on_audioplayer_playbackfailed(self, event, context):
         self.logger.debug("Executing on_audioplayer_playbackfailed_request")
@@ -150,63 +165,35 @@ class AlexaBwBHandler(AlexaAudioBaseHandler):
         except:
             pass
 
-    def on_resume_intent(self, intent_request, session):
-        self.logger.debug("Executing on_resume_intent")
-        try:
-            self.logger.debug(intent_request)
-            self.logger.debug(session)
-            return self._play_song(silent=True)
-        except:
-            raise MyAudioException("An error occurred trying to resume audio")
-
 
     def on_previous_intent(self, intent_request, session):
-        return self._play_song(silent=True)
+        queue = self.get_queue(session)
+        if queue.previous() is None:
+            return self._build_audio_response("That was the first song", "BwB", "That was the first song")
+        return self._play_song(queue, silent=True)
 
     def on_shuffleoff_intent(self, intent_request, session):
-        return self._build_audio_response("Shuffle off is not yet supported", "BwB", 'Shuffle off is not yet supported')
+        queue = self.get_queue(session)
+        queue.shuffle(False)
+        return self._continue_song(queue, session)
 
     def on_shuffleon_intent(self, intent_request, session):
-        return self._build_audio_response("Shuffle on is not yet supported", "BwB", 'Shuffle on is not yet supported')
-
-    def on_audioplayer_playbackstarted(self, event, context):
-        self.logger.debug("Executing on_audioplayer_playbackstarted_request")
-        return None
+        queue = self.get_queue(session)
+        queue.shuffle(True)
+        return self._continue_song(queue, session)
 
+    # on_audioplayer_playbackstarted is handled by AlexaAudioBaseHandler, which
+    # resolves the stream url of the next song.  Set self.stream_resolver to a
+    # function that returns (url, expires_at) for songs with signed urls.
 
     def on_loopoff_intent(self, intent_request, session):
-        return self._build_audio_response("Loop off is not yet supported", "BwB", 'Loop off is not yet supported')
-
-    def on_playbackcontroller_pausecommandissued(self, event, context):
-        try:
-            self.logger.debug("Executing on_playbackcontroller_pausecommandissued_request")
-            self.logger.debug(event)
-        except:
-            pass
-
-        return None
-
-    def on_audioplayer_playbackstopped(self, event, context):
-        self.logger.debug("Executing on_audioplayer_playbackstopped_request")
-        try:
-            self.logger.debug("Executing on_audioplayer_playbackstopped_request: event: {0}".format(event))
-
-        except:
-            pass
-
-        return None
-
-    def on_pause_intent(self, intent_request, session):
-        self.logger.debug("Executing on_pause_intent")
-        try:
-            self.logger.debug("AlexaBwBHandler.on_pause_intent: intent_request: {0}".format(intent_request))
-            self.logger.debug("AlexaBwBHandler.on_pause_intent: session: {0}".format(session))
-        except:
-            pass
+        queue = self.get_queue(session)
+        queue.set_loop(LOOP_OFF)
+        return self._continue_song(queue, session)
 
-        response = self.create_stop_directive()
-        self.logger.debug("on_pause_intent response: {0}".format(response))
-        return response
+    # on_pause_intent, on_resume_intent, on_audioplayer_playbackstopped and the
+    # playbackcontroller pause and play commands are handled by AlexaAudioBaseHandler,
+    # which records where the song was stopped and resumes it from there
 
     def on_audioplayer_playbacknearlyfinished(self, event, context):
         self.logger.debug("Executing on_audioplayer_playbacknearlyfinished_request")
@@ -214,18 +201,20 @@ class AlexaBwBHandler(AlexaAudioBaseHandler):
         return self._enqueue_song(current_token)
 
     def on_loopon_intent(self, intent_request, session):
-        return self._build_audio_response("Loop on is not yet supported", "BwB", 'Loop on is not yet supported')
+        queue = self.get_queue(session)
+        queue.set_loop(LOOP_ALL)
+        return self._continue_song(queue, session)
 
     def on_cancel_intent(self, intent_request, session):
         self.logger.debug("Executing on_cancel_intent")
         return self.create_stop_directive()
 
     def on_repeat_intent(self, intent_request, session):
-        return self._play_song()
+        return self._play_song(self.get_queue(session))
 
     def on_playbaconintent_intent(self, intent_request, session):
         self.logger.debug("Executing on_playbacon_intent")
-        return self._play_song()
+        return self._play_song(self.get_queue(session))
 
 """
 
@@ -5,6 +5,20 @@ import zipfile
 import sys
 import getopt
 import shutil
+import hashlib
+import platform
+import json
+import struct
+import zlib
+import multiprocessing
+import fnmatch
+import ast
+import csv
+import re
+import tempfile
+import importlib.machinery
+import importlib.util
+import py_compile
 
 """
 Script will create an AWS Lambda function deployment.
@@ -23,6 +37,33 @@ to be in the requirements.txt file.
 The implementation files are expected to be in the root project directory, and
 this command does not currently support deeply nested file structures.
 
+The requirements are resolved in one pip run, from a local wheel cache, and
+the installed tree is kept in the cache directory keyed by a hash of the
+resolved wheels and the python version.  When the resolved packages do not
+change the tree is copied from the cache instead of being installed again.
+When the requirements file pins every package with ==, e.g. the output of
+pip freeze, pip is not run at all once the tree is cached.
+
+The deployment zip is deterministic, the entries are sorted and have fixed
+timestamps, so the same files always give a byte identical zip.  Next to each
+zip a manifest with the sha256 of every file is written, and files that did not
+change since the previous deployment are copied into the new zip as the
+compressed bytes of the previous zip instead of being compressed again.  The
+other files are hashed and compressed on a pool of worker processes and the
+zip is assembled in sorted order.  Files that are already compressed, like
+images and archives, are stored as they are.
+
+Before the zip is created the deployment is slimmed: files matching the exclude
+patterns, e.g. tests, __pycache__ of the build interpreter, docs and type stubs
+outside of packages, are removed, the python files are precompiled into hash based .pyc files, so
+the lambda does not compile them on every cold start, and a size report per
+top level package is printed.
+
+With --shake the import graph of the included files is followed and the
+packages, or with --shake-modules also the modules, that they never import are
+removed.  Modules that are imported dynamically can be kept with --allow, and
+--verify imports the handler from the finished deployment in a new process.
+
 """
 
 root_deployments_dir = ''
@@ -35,6 +76,22 @@ deployment_files = []
 
 default_requirements_file_name = "requirements.txt"
 
+# directory with the wheel cache and the cached install trees
+cache_dir = os.environ.get("PYALEXASKILL_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "pyalexaskill"))
+
+test_index_url = "https://testpypi.python.org/pypi"
+
+# timestamp of every entry in the deployment zip, the earliest a zip can hold
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+default_compress_level = 6
+
+# files with these extensions are already compressed and are stored without compressing them again
+stored_extensions = frozenset([
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.lzma', '.7z', '.whl', '.egg', '.jar',
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp3', '.mp4', '.m4a', '.ogg', '.woff', '.woff2',
+])
+
 def _read_test_requirements():
     filename = os.path.join(root_project_dir, "requirements-test.txt")
     if not os.path.exists(filename):
@@ -91,31 +148,547 @@ def _make_deployment_dir():
 
     return (new_deployment_dir_path, deployment_name)
 
+def _requirement_lines(deployment_requirements):
+    lines = []
+    for requirement in deployment_requirements:
+        requirement = requirement.strip()
+        if requirement and not requirement.startswith('#'):
+            lines.append(requirement)
+    return lines
+
+
+def _requirements_key(parts, index_url=None):
+    """
+    Hash of the parts, the index and the python the packages are installed for
+    """
+    key = hashlib.sha256()
+    for part in sorted(set(parts)) + [index_url or '', platform.python_version(), sys.platform, platform.machine()]:
+        key.update(part.encode('utf-8'))
+        key.update(b'\n')
+    return key.hexdigest()[:24]
+
+
+def _canonical_name(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+_PINNED_RE = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)(?:\[[^\]]*\])?\s*==\s*([^\s=;,*]+)$")
+
+
+def _pinned_packages(requirement_lines):
+    """
+    :return: set of (name, version) if every line pins one package with ==, otherwise None
+    """
+    packages = set()
+    for line in requirement_lines:
+        match = _PINNED_RE.match(line)
+        if match is None:
+            return None
+        packages.add((_canonical_name(match.group(1)), match.group(2)))
+    return packages
+
+
+def _wheel_packages(wheel_names):
+    # wheel file names are name-version-...whl, with - in the name escaped as _
+    return set((_canonical_name(name.split("-")[0]), name.split("-")[1]) for name in wheel_names)
+
+def _copy_tree(from_dir, to_dir):
+    for (dir_path, dir_names, file_names) in os.walk(from_dir):
+        target_dir = os.path.join(to_dir, os.path.relpath(dir_path, from_dir))
+        _mkdirp(target_dir)
+        for file_name in file_names:
+            shutil.copy2(os.path.join(dir_path, file_name), os.path.join(target_dir, file_name))
+
+
+def _pip(args):
+    cmd = [sys.executable, "-m", "pip"] + args
+    return_code = subprocess.call(cmd, shell=False)
+    if return_code != 0:
+        raise RuntimeError("pip failed with exit code {0}: {1}".format(return_code, " ".join(cmd)))
+
+
+def _cached_install(deployment_requirements, deployment_dir, index_url=None):
+    """
+    Install the requirements into deployment_dir.  All requirements are resolved
+    together by one pip wheel run, using the wheel cache, and the install tree in
+    the cache for the resolved set of wheels is copied into deployment_dir.  The
+    tree is built with pip install from the wheels the first time that set is seen.
+
+    When every requirement is pinned with == and a previous run resolved exactly
+    those packages, the file pins all dependencies and pip is not run at all.
+    :param deployment_requirements: lines of a requirements file
+    :param deployment_dir:
+    :param index_url: package index, None for pip's default
+    :return: True if the install tree came from the cache
+    """
+    requirement_lines = _requirement_lines(deployment_requirements)
+    if not requirement_lines or not os.path.exists(deployment_dir):
+        return False
+
+    # requirement lines that pin every package -> key of their install tree
+    pinned_dir = os.path.join(cache_dir, "pinned")
+    pinned = _pinned_packages(requirement_lines)
+    pinned_file = os.path.join(pinned_dir, _requirements_key(requirement_lines, index_url)) if pinned else None
+
+    key = None
+    if pinned_file is not None and os.path.exists(pinned_file):
+        with open(pinned_file) as f:
+            key = f.read().strip()
+        if not os.path.exists(os.path.join(cache_dir, "installs", key, ".complete")):
+            key = None
+
+    wheels = None
+    resolved_dir = None
+    try:
+        if key is None:
+            wheel_dir = os.path.join(cache_dir, "wheels")
+            _mkdirp(wheel_dir)
+            resolved_dir = tempfile.mkdtemp(prefix="wheels-", dir=cache_dir)
+            requirements_file = os.path.join(resolved_dir, "requirements.txt")
+            with open(requirements_file, 'w') as f:
+                f.write("\n".join(requirement_lines) + "\n")
+
+            # pip wheel writes the wheel of every resolved package, cached or not, to
+            # resolved_dir, so its file names are the resolved set
+            index_args = ["-i", index_url] if index_url else []
+            _pip(["wheel", "-q", "-r", requirements_file, "-w", resolved_dir, "--find-links", wheel_dir] + index_args)
+            wheels = sorted(name for name in os.listdir(resolved_dir) if name.endswith(".whl"))
+            key = _requirements_key(wheels, index_url)
+
+        install_dir = os.path.join(cache_dir, "installs", key)
+        cached = os.path.exists(os.path.join(install_dir, ".complete"))
+        if cached:
+            print("Using cached requirements install: {0}".format(install_dir))
+        else:
+            shutil.rmtree(install_dir, ignore_errors=True)
+            building_dir = install_dir + ".building"
+            shutil.rmtree(building_dir, ignore_errors=True)
+            try:
+                _pip(["install", "-q", "--no-index", "--find-links", resolved_dir, "-r", requirements_file,
+                      "-t", building_dir])
+                with open(os.path.join(building_dir, ".complete"), 'w') as f:
+                    f.write("\n".join(wheels) + "\n")
+                os.rename(building_dir, install_dir)
+            finally:
+                # only left behind when the install failed
+                shutil.rmtree(building_dir, ignore_errors=True)
+
+        if wheels is not None:
+            for name in wheels:
+                cached_wheel = os.path.join(wheel_dir, name)
+                if not os.path.exists(cached_wheel):
+                    shutil.move(os.path.join(resolved_dir, name), cached_wheel)
+            if pinned_file is not None and pinned == _wheel_packages(wheels):
+                _mkdirp(pinned_dir)
+                with open(pinned_file, 'w') as f:
+                    f.write(key)
+    finally:
+        if resolved_dir is not None:
+            shutil.rmtree(resolved_dir, ignore_errors=True)
+
+    _copy_tree(install_dir, deployment_dir)
+    marker = os.path.join(deployment_dir, ".complete")
+    if os.path.exists(marker):
+        os.remove(marker)
+    return cached
+
+
 def _install_test_requirements(deployment_requirements, deployment_dir):
     """
-    pip install -i https://testpypi.python.org/pypi <requirements line> -t <deployment_dir>
+    pip install -i https://testpypi.python.org/pypi -r <requirements> -t <deployment_dir>, through the cache
     :param deployment_requirements
     :param deployment_dir:
     :return:
     """
-    if os.path.exists(deployment_dir):
-        for requirement in deployment_requirements:
-            if not requirement.startswith('#'):
-                cmd = "pip install -i https://testpypi.python.org/pypi {0} -t {1}".format(requirement, deployment_dir).split()
-                return_code = subprocess.call(cmd, shell=False)
+    return _cached_install(deployment_requirements, deployment_dir, test_index_url)
 
 def _install_requirements(deployment_requirements, deployment_dir):
     """
-    pip install <requirements line> -t <deployment_dir>
+    pip install -r <requirements> -t <deployment_dir>, through the cache
     :param deployment_requirements
     :param deployment_dir:
     :return:
     """
-    if os.path.exists(deployment_dir):
-        for requirement in deployment_requirements:
-            if not requirement.startswith('#'):
-                cmd = "pip install {0} -t {1}".format(requirement, deployment_dir).split()
-                return_code = subprocess.call(cmd, shell=False)
+    return _cached_install(deployment_requirements, deployment_dir)
+
+
+# files and directories removed from the deployment by the slimming stage.  Patterns
+# without a / match any file or directory name, patterns with a / match the end of
+# the path, and patterns starting with / match from the root of the deployment.
+# Directories that are importable packages, or sit inside one, are never removed
+# as a whole, e.g. botocore/docs is imported at runtime, so tests and docs only
+# remove plain data directories.
+default_exclude_patterns = [
+    "__pycache__",
+    "*.pyc",
+    "*.pyo",
+    "tests",
+    "docs",
+    "*.pyi",
+    "*-stubs",
+    "*.pyx",
+    "*.pxd",
+    "*.dist-info/RECORD",
+    "*.dist-info/INSTALLER",
+    "*.dist-info/REQUESTED",
+    "*.dist-info/direct_url.json",
+    "/bin",
+]
+
+
+def _excluded(rel_path, patterns, packages=frozenset()):
+    """
+    :param rel_path: file path relative to the deployment, with / separators
+    :param patterns: list of patterns, see default_exclude_patterns
+    :param packages: directories, relative to the deployment, that are never matched as a whole
+    """
+    parts = rel_path.split("/")
+    dirs = ["/".join(parts[:i]) for i in range(1, len(parts))]
+    dirs = [d for d in dirs if d not in packages]
+    for pattern in patterns:
+        if pattern.startswith("/"):
+            if fnmatch.fnmatch(rel_path, pattern[1:]) or any(fnmatch.fnmatch(d, pattern[1:]) for d in dirs):
+                return True
+        elif "/" in pattern:
+            if any(fnmatch.fnmatch("/".join(parts[i:]), pattern) for i in range(len(parts))):
+                return True
+        elif fnmatch.fnmatch(parts[-1], pattern) or any(fnmatch.fnmatch(d.rsplit("/", 1)[-1], pattern) for d in dirs):
+            return True
+    return False
+
+
+def _package_dirs(deployment_dir):
+    """
+    :return: set of the directories, relative to deployment_dir, that contain an
+             __init__.py or sit inside a directory that does
+    """
+    packages = set()
+    for (dir_path, dir_names, file_names) in os.walk(deployment_dir):
+        rel_dir = os.path.relpath(dir_path, deployment_dir).replace(os.path.sep, "/")
+        if rel_dir == ".":
+            continue
+        if "__init__.py" in file_names or rel_dir.rpartition("/")[0] in packages:
+            packages.add(rel_dir)
+    return packages
+
+
+def _slim_deployment(deployment_dir, exclude_patterns, keep_paths=()):
+    """
+    Remove the files matching the exclude patterns, and the directories left empty
+    :param deployment_dir:
+    :param exclude_patterns: list of patterns, see default_exclude_patterns
+    :param keep_paths: paths relative to deployment_dir that are never removed, e.g. the include files
+    :return: list of the removed paths, relative to deployment_dir
+    """
+    keep_paths = set(keep_paths)
+    packages = _package_dirs(deployment_dir)
+    removed = []
+    for (dir_path, dir_names, file_names) in os.walk(deployment_dir, topdown=False):
+        for file_name in file_names:
+            rel_path = os.path.relpath(os.path.join(dir_path, file_name), deployment_dir).replace(os.path.sep, "/")
+            if rel_path not in keep_paths and _excluded(rel_path, exclude_patterns, packages):
+                os.remove(os.path.join(dir_path, file_name))
+                removed.append(rel_path)
+        if dir_path != deployment_dir and not os.listdir(dir_path):
+            os.rmdir(dir_path)
+    return removed
+
+
+def _precompile(deployment_dir, strip_docstrings=False):
+    """
+    Write an unchecked hash based .pyc for every python file, so the lambda, whose
+    files are read only, does not compile the sources on every cold start.  Hash
+    based .pyc files do not change when only the timestamps of the sources change.
+    :param strip_docstrings: compile the modules like python -OO, without their
+                             docstrings and assert statements
+    :return: (number of files compiled, list of files that could not be compiled)
+    """
+    compiled = 0
+    failed = []
+    for (dir_path, dir_names, file_names) in os.walk(deployment_dir):
+        for file_name in file_names:
+            if not file_name.endswith(".py"):
+                continue
+            path = os.path.join(dir_path, file_name)
+            rel_path = os.path.relpath(path, deployment_dir).replace(os.path.sep, "/")
+            # the .pyc goes where a plain python, as the lambda runtime, looks for it,
+            # also when it is optimized
+            try:
+                py_compile.compile(path, cfile=importlib.util.cache_from_source(path), dfile=rel_path, doraise=True,
+                                   optimize=2 if strip_docstrings else -1,
+                                   invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+            except py_compile.PyCompileError:
+                failed.append(rel_path)
+                continue
+            compiled += 1
+    return compiled, failed
+
+
+def _package_sizes(deployment_dir):
+    """
+    :return: dict of top level file or directory name -> size in bytes
+    """
+    sizes = {}
+    for (dir_path, dir_names, file_names) in os.walk(deployment_dir):
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            top = os.path.relpath(path, deployment_dir).split(os.path.sep)[0]
+            sizes[top] = sizes.get(top, 0) + os.path.getsize(path)
+    return sizes
+
+
+def _print_size_report(before, after):
+    print("{0:<40} {1:>12} {2:>12}".format("package", "before", "after"))
+    for name in sorted(before, key=lambda name: -before[name]):
+        print("{0:<40} {1:>12,} {2:>12,}".format(name, before[name], after.get(name, 0)))
+    print("{0:<40} {1:>12,} {2:>12,}".format("total", sum(before.values()), sum(after.values())))
+
+
+_EXTENSION_SUFFIXES = tuple(importlib.machinery.EXTENSION_SUFFIXES) + (".so", ".pyd")
+
+
+def _module_name(rel_path):
+    """
+    :return: dotted module name of a python or extension module file, or None
+    """
+    if rel_path.endswith(".py"):
+        parts = rel_path[:-len(".py")].split("/")
+    else:
+        suffix = next((suffix for suffix in _EXTENSION_SUFFIXES if rel_path.endswith(suffix)), None)
+        if suffix is None:
+            return None
+        parts = rel_path[:-len(suffix)].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    if not parts or not all(part.isidentifier() for part in parts):
+        return None
+    return ".".join(parts)
+
+
+def _deployment_modules(deployment_dir):
+    """
+    :return: dict of dotted module name -> path relative to deployment_dir, for the
+             python and extension modules outside of __pycache__ and metadata directories
+    """
+    modules = {}
+    for (dir_path, dir_names, file_names) in os.walk(deployment_dir):
+        dir_names[:] = [name for name in dir_names if name.isidentifier()]
+        for file_name in file_names:
+            rel_path = os.path.relpath(os.path.join(dir_path, file_name), deployment_dir).replace(os.path.sep, "/")
+            name = _module_name(rel_path)
+            if name is not None and (name not in modules or rel_path.endswith(".py")):
+                modules[name] = rel_path
+    return modules
+
+
+def _imported_names(source, rel_path, module_name):
+    """
+    Static imports of a module: import and from import statements anywhere in the
+    module, and importlib.import_module and __import__ calls with a literal name
+    :return: list of dotted names, a name ending in .* stands for the whole package
+    """
+    try:
+        tree = ast.parse(source, rel_path)
+    except (SyntaxError, ValueError):
+        return []
+    is_package = rel_path.endswith("__init__.py")
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                package = module_name if is_package else module_name.rpartition(".")[0]
+                parts = package.split(".") if package else []
+                if node.level > 1:
+                    parts = parts[:-(node.level - 1)]
+                base = ".".join(parts + ([node.module] if node.module else []))
+            else:
+                base = node.module
+            if not base:
+                continue
+            names.append(base)
+            for alias in node.names:
+                names.append(base + (".*" if alias.name == "*" else "." + alias.name))
+        elif isinstance(node, ast.Call) and node.args and isinstance(node.args[0], ast.Constant) \
+                and isinstance(node.args[0].value, str):
+            func = node.func
+            func_name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", None)
+            if func_name in ("import_module", "__import__"):
+                names.append(node.args[0].value)
+    return names
+
+
+def _reachable_modules(deployment_dir, modules, roots, allow_patterns):
+    """
+    :param modules: result of _deployment_modules
+    :param roots: paths relative to deployment_dir of the python files to start from
+    :param allow_patterns: patterns of module names that are always reachable, e.g. 'botocore.*'
+    :return: set of the reachable module names
+    """
+    reached = set()
+    pending = []
+
+    def reach(name):
+        if name.endswith(".*"):
+            package = name[:-2]
+            pending.extend(module for module in modules if module == package or module.startswith(package + "."))
+            name = package
+        parts = name.split(".")
+        for i in range(1, len(parts) + 1):
+            pending.append(".".join(parts[:i]))
+
+    for rel_path in roots:
+        for name in _imported_names(_read_source(deployment_dir, rel_path), rel_path, _module_name(rel_path) or ""):
+            reach(name)
+    for pattern in allow_patterns:
+        for module in modules:
+            if fnmatch.fnmatch(module, pattern):
+                reach(module)
+
+    while pending:
+        name = pending.pop()
+        if name in reached or name not in modules:
+            continue
+        reached.add(name)
+        rel_path = modules[name]
+        if rel_path.endswith(".py"):
+            for imported in _imported_names(_read_source(deployment_dir, rel_path), rel_path, name):
+                reach(imported)
+    return reached
+
+
+def _read_source(deployment_dir, rel_path):
+    with open(os.path.join(deployment_dir, rel_path), 'rb') as f:
+        return f.read()
+
+
+def _remove_path(deployment_dir, rel_path):
+    path = os.path.join(deployment_dir, rel_path)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+        if path.endswith(".py"):
+            cache_path = importlib.util.cache_from_source(path)
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+
+
+def _dist_info_top_levels(dist_info_dir):
+    """
+    :return: set of the top level package and module names of a distribution
+    """
+    top_level = os.path.join(dist_info_dir, "top_level.txt")
+    if os.path.isfile(top_level):
+        with open(top_level, 'r') as f:
+            return set(line.strip() for line in f if line.strip())
+    record = os.path.join(dist_info_dir, "RECORD")
+    if os.path.isfile(record):
+        top_levels = set()
+        with open(record, 'r', newline='') as f:
+            for row in csv.reader(f):
+                if not row:
+                    continue
+                path = row[0]
+                first = path.split("/")[0]
+                if "/" not in path:
+                    # a single module distribution, e.g. six.py or an extension module
+                    first = _module_name(path)
+                elif first.endswith(".dist-info") or first.endswith(".data") or first in ("..", "__pycache__"):
+                    continue
+                if first:
+                    top_levels.add(first)
+        return top_levels
+    # without metadata, guess from the distribution name
+    return set([os.path.basename(dist_info_dir).split("-")[0].lower().replace("-", "_").replace(".", "_")])
+
+
+def _all_dist_info_top_levels(deployment_dir):
+    """
+    Read before slimming, which removes the RECORD files
+    :return: dict of .dist-info and .egg-info directory name -> set of top level names
+    """
+    top_levels = {}
+    for name in os.listdir(deployment_dir):
+        path = os.path.join(deployment_dir, name)
+        if (name.endswith(".dist-info") or name.endswith(".egg-info")) and os.path.isdir(path):
+            top_levels[name] = _dist_info_top_levels(path)
+    return top_levels
+
+
+def _shake_deployment(deployment_dir, roots, allow_patterns=(), modules_mode=False, dist_info_top_levels=None):
+    """
+    Remove the packages, and in modules mode the modules, that are not reachable
+    through the static imports of the root files.
+    :param roots: paths relative to deployment_dir of the files to start from, they are never removed
+    :param allow_patterns: module name patterns that are kept, for dynamic imports
+    :param modules_mode: also remove modules of reachable packages.  Packages with
+                         extension modules are always kept whole, extension modules
+                         import python modules that cannot be seen.
+    :param dist_info_top_levels: result of _all_dist_info_top_levels, read from the
+                                 metadata if not supplied
+    :return: list of the removed paths relative to deployment_dir
+    """
+    modules = _deployment_modules(deployment_dir)
+    reached = _reachable_modules(deployment_dir, modules, roots, allow_patterns)
+    reached_top = set(name.split(".")[0] for name in reached)
+    root_paths = set(roots)
+    removed = []
+
+    removed_top = set()
+    for name in sorted(os.listdir(deployment_dir)):
+        top = _module_name(name + "/__init__.py") if os.path.isdir(os.path.join(deployment_dir, name)) else _module_name(name)
+        if top is None or top in reached_top or name in root_paths or top not in modules and not any(
+                module.startswith(top + ".") for module in modules):
+            continue
+        _remove_path(deployment_dir, name)
+        removed.append(name)
+        removed_top.add(top)
+
+    for name in sorted(os.listdir(deployment_dir)):
+        path = os.path.join(deployment_dir, name)
+        if (name.endswith(".dist-info") or name.endswith(".egg-info")) and os.path.isdir(path):
+            # metadata of a distribution whose packages were all removed
+            if dist_info_top_levels is not None and name in dist_info_top_levels:
+                top_levels = dist_info_top_levels[name]
+            else:
+                top_levels = _dist_info_top_levels(path)
+            if top_levels & removed_top and not top_levels & reached_top:
+                _remove_path(deployment_dir, name)
+                removed.append(name)
+
+    if modules_mode:
+        with_extensions = set(rel_path.split("/")[0] for rel_path in modules.values() if not rel_path.endswith(".py"))
+        for name, rel_path in sorted(modules.items()):
+            top = rel_path.split("/")[0]
+            if name in reached or not rel_path.endswith(".py") or top in with_extensions or top in removed_top \
+                    or rel_path in root_paths or "/" not in rel_path:
+                continue
+            if rel_path.endswith("/__init__.py"):
+                # a package that is never imported, with everything in it
+                package_dir = rel_path[:-len("/__init__.py")]
+                if os.path.isdir(os.path.join(deployment_dir, package_dir)) and not any(
+                        module == name or module.startswith(name + ".") for module in reached):
+                    _remove_path(deployment_dir, package_dir)
+                    removed.append(package_dir + "/")
+            elif os.path.exists(os.path.join(deployment_dir, rel_path)):
+                _remove_path(deployment_dir, rel_path)
+                removed.append(rel_path)
+    return removed
+
+
+def _verify_deployment(deployment_dir, entry_module, allow_patterns=()):
+    """
+    Import the entry module, and the allowed modules that are not patterns, from
+    the deployment in a new python process without site-packages
+    :return: True if the imports succeed
+    """
+    names = [entry_module] + [pattern for pattern in allow_patterns if not any(c in pattern for c in "*?[")]
+    script = "import sys; sys.path.insert(0, {0!r})\n".format(os.path.abspath(deployment_dir)) + \
+             "".join("import {0}\n".format(name) for name in names)
+    return_code = subprocess.call([sys.executable, "-S", "-c", script], cwd=deployment_dir, shell=False)
+    return return_code == 0
 
 
 def _copy_deployment_files(deployment_data):
@@ -128,7 +701,107 @@ def _copy_deployment_files(deployment_data):
             raise NameError("Deployment file not found [{0}]".format(item['from']))
 
 
-def zipdir(dirPath=None, zipFilePath=None, includeDirInZip=False):
+def _manifest_path(zip_path):
+    return zip_path + ".manifest.json"
+
+
+def _read_manifest(zip_path):
+    if not zip_path or not os.path.isfile(zip_path) or not os.path.isfile(_manifest_path(zip_path)):
+        return None
+    manifest_path = _manifest_path(zip_path)
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        return None
+
+
+def _content_hash(file_hashes, compress_level):
+    digest = hashlib.sha256("level={0}\n".format(compress_level).encode('utf-8'))
+    for archive_path in sorted(file_hashes):
+        digest.update("{0}\0{1}\n".format(archive_path, file_hashes[archive_path]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _compress_file(job):
+    """
+    Hash and compress one file, runs in the worker processes
+    :param job: (file path, sha256 of the file in the previous zip, compression level)
+    :return: (sha256, crc, file size, compress type, compressed bytes), the
+             compressed bytes are None if the file matches the previous hash
+    """
+    file_path, previous_hash, compress_level = job
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    file_hash = hashlib.sha256(data).hexdigest()
+    if file_hash == previous_hash:
+        return file_hash, None, len(data), None, None
+
+    crc = zlib.crc32(data) & 0xffffffff
+    if os.path.splitext(file_path)[1].lower() in stored_extensions:
+        return file_hash, crc, len(data), zipfile.ZIP_STORED, data
+    # raw deflate stream, the same zipfile writes
+    compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15)
+    return file_hash, crc, len(data), zipfile.ZIP_DEFLATED, compressor.compress(data) + compressor.flush()
+
+
+def _expected_compress_type(file_path):
+    if os.path.splitext(file_path)[1].lower() in stored_extensions:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _zip_info(archive_path, mode):
+    zip_info = zipfile.ZipInfo(archive_path, date_time=ZIP_DATE_TIME)
+    zip_info.create_system = 3
+    if archive_path.endswith("/"):
+        zip_info.external_attr = (0o40755 << 16) | 0x10
+    else:
+        zip_info.external_attr = (0o100755 if mode & 0o111 else 0o100644) << 16
+    return zip_info
+
+
+def _read_raw_entry(fp, zip_info):
+    """
+    :return: the compressed bytes of an entry of an open zip file
+    """
+    fp.seek(zip_info.header_offset)
+    header = fp.read(30)
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    fp.seek(zip_info.header_offset + 30 + name_length + extra_length)
+    return fp.read(zip_info.compress_size)
+
+
+def _write_raw_entry(zip_file, zip_info, raw):
+    """
+    Write an entry whose compressed bytes, CRC and sizes are already known,
+    laid out exactly like ZipFile.writestr lays out an entry
+    """
+    zip_info.header_offset = zip_file.fp.tell()
+    zip64 = zip_info.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    zip_file.fp.write(zip_info.FileHeader(zip64))
+    zip_file.fp.write(raw)
+    zip_file.filelist.append(zip_info)
+    zip_file.NameToInfo[zip_info.filename] = zip_info
+    zip_file.start_dir = zip_file.fp.tell()
+
+
+def _latest_deployment_zip(deployments_dir):
+    """
+    :return: path of the deployment zip with the highest number that has a manifest, or None
+    """
+    latest = (-1, None)
+    if os.path.isdir(deployments_dir):
+        for name in os.listdir(deployments_dir):
+            parts = name[:-len(".zip")].split("_") if name.endswith(".zip") else []
+            if len(parts) == 2 and parts[0] == "deployment" and parts[1].isdigit():
+                path = os.path.join(deployments_dir, name)
+                if int(parts[1]) > latest[0] and os.path.isfile(_manifest_path(path)):
+                    latest = (int(parts[1]), path)
+    return latest[1]
+
+
+def zipdir(dirPath=None, zipFilePath=None, includeDirInZip=False, previousZipPath=None, compressLevel=None, workers=None):
     """
     Attribution:  I wish I could remember where I found this on the
     web.  To the unknown sharer of knowledge - thank you.
@@ -156,6 +829,19 @@ def zipdir(dirPath=None, zipFilePath=None, includeDirInZip=False):
     includeDirInZip -- boolean indicating whether the top level directory should
     be included in the archive or omitted. (default True)
 
+    previousZipPath -- zip created by an earlier zipdir call.  Files with the
+    same content are copied from it without compressing them again.
+
+    compressLevel -- zlib compression level, 0 to 9 (default 6)
+
+    workers -- number of processes that hash and compress the files, 1 to do
+    it in this process (default is the number of cpus)
+
+    The zip is deterministic and a manifest with the sha256 of every file is
+    written next to it.  Returns a dict with the number of files, how many were
+    reused from previousZipPath and compressed, the content hash, and whether
+    the content is unchanged from previousZipPath.
+
 """
     if not zipFilePath:
         zipFilePath = dirPath + ".zip"
@@ -173,22 +859,92 @@ def zipdir(dirPath=None, zipFilePath=None, includeDirInZip=False):
             archivePath = archivePath.replace(dirToZip + os.path.sep, "", 1)
         return os.path.normcase(archivePath)
 
-    outFile = zipfile.ZipFile(zipFilePath, "w",
-                              compression=zipfile.ZIP_DEFLATED)
+    if compressLevel is None:
+        compressLevel = default_compress_level
+
+    # archive path -> file path, None for empty directories
+    entries = {}
     for (archiveDirPath, dirNames, fileNames) in os.walk(dirPath):
         for fileName in fileNames:
             filePath = os.path.join(archiveDirPath, fileName)
-            outFile.write(filePath, trimPath(filePath))
+            entries[trimPath(filePath).replace(os.path.sep, "/")] = filePath
         # Make sure we get empty directories as well
         if not fileNames and not dirNames:
-            zipInfo = zipfile.ZipInfo(trimPath(archiveDirPath) + "/")
-            # some web sites suggest doing
-            # zipInfo.external_attr = 16
-            # or
-            # zipInfo.external_attr = 48
-            # Here to allow for inserting an empty directory.  Still TBD/TODO.
-            outFile.writestr(zipInfo, "")
-    outFile.close()
+            entries[trimPath(archiveDirPath).replace(os.path.sep, "/") + "/"] = None
+
+    previous_manifest = _read_manifest(previousZipPath)
+    if previous_manifest is not None and previous_manifest.get('compress_level') != compressLevel:
+        previous_manifest = None
+    previous_hashes = previous_manifest['files'] if previous_manifest else {}
+    previous_zip = zipfile.ZipFile(previousZipPath) if previous_manifest else None
+    previous_fp = open(previousZipPath, 'rb') if previous_manifest else None
+
+    archive_paths = sorted(entries)
+    jobs = []
+    for archive_path in archive_paths:
+        filePath = entries[archive_path]
+        if filePath is not None:
+            # only offer the previous hash if the previous zip can be reused for the entry
+            previous_info = previous_zip.NameToInfo.get(archive_path) if previous_zip is not None else None
+            reusable = previous_info is not None and previous_info.compress_type == _expected_compress_type(filePath)
+            jobs.append((filePath, previous_hashes.get(archive_path) if reusable else None, compressLevel))
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(workers) if workers > 1 and len(jobs) > 1 else None
+
+    file_hashes = {}
+    reused = 0
+    compressed = 0
+    try:
+        # results come back in the order of the jobs, the sorted order of the entries
+        results = pool.imap(_compress_file, jobs, chunksize=16) if pool is not None else map(_compress_file, jobs)
+        outFile = zipfile.ZipFile(zipFilePath, "w", compression=zipfile.ZIP_DEFLATED)
+        for archive_path in archive_paths:
+            filePath = entries[archive_path]
+            if filePath is None:
+                outFile.writestr(_zip_info(archive_path, 0), b"", compress_type=zipfile.ZIP_STORED)
+                continue
+
+            file_hash, crc, file_size, compress_type, raw = next(results)
+            file_hashes[archive_path] = file_hash
+            zip_info = _zip_info(archive_path, os.stat(filePath).st_mode)
+            if raw is None:
+                previous_info = previous_zip.NameToInfo[archive_path]
+                zip_info.compress_type = previous_info.compress_type
+                zip_info.CRC = previous_info.CRC
+                zip_info.file_size = previous_info.file_size
+                zip_info.compress_size = previous_info.compress_size
+                raw = _read_raw_entry(previous_fp, previous_info)
+                reused += 1
+            else:
+                zip_info.compress_type = compress_type
+                zip_info.CRC = crc
+                zip_info.file_size = file_size
+                zip_info.compress_size = len(raw)
+                compressed += 1
+            _write_raw_entry(outFile, zip_info, raw)
+        outFile.close()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if previous_zip is not None:
+            previous_zip.close()
+            previous_fp.close()
+
+    content_hash = _content_hash(file_hashes, compressLevel)
+    with open(_manifest_path(zipFilePath), 'w') as f:
+        json.dump({'content_hash': content_hash, 'compress_level': compressLevel, 'files': file_hashes},
+                  f, indent=0, sort_keys=True)
+
+    return {
+        'files': len(file_hashes),
+        'reused': reused,
+        'compressed': compressed,
+        'content_hash': content_hash,
+        'unchanged': previous_manifest is not None and previous_manifest.get('content_hash') == content_hash
+    }
 
 
 def make_target_dirs(target_paths):
@@ -198,15 +954,34 @@ def make_target_dirs(target_paths):
 
 
 def main(argv):
-    global root_deployments_dir, root_project_dir, default_requirements_file_name
+    global root_deployments_dir, root_project_dir, default_requirements_file_name, cache_dir
     include_files = ''
+    compress_level = default_compress_level
+    workers = None
+    slim = True
+    exclude_patterns = list(default_exclude_patterns)
+    precompile = True
+    strip_docstrings = False
+    target_python = "{0}.{1}".format(*sys.version_info[:2])
+    shake = None
+    allow_patterns = []
+    verify = False
+    entry_file = None
 
     try:
-        opts, args = getopt.getopt(argv, "hr:i:l:", ["root=", "include=", "libraries"])
+        opts, args = getopt.getopt(argv, "hr:i:l:c:z:j:x:e:", ["root=", "include=", "libraries=", "cache=", "compress-level=", "jobs=",
+                                                               "exclude=", "keep=", "no-slim", "no-compile",
+                                                               "strip-docstrings", "target-python=", "shake",
+                                                               "shake-modules", "allow=", "verify", "entry="])
     except getopt.GetoptError:
-        print('create_aws_lambda.py -r <root project dir> -i <include files> -l <file of python libraries, e.g. requirements.txt>')
+        print('create_aws_lambda.py -r <root project dir> -i <include files> -l <file of python libraries, e.g. requirements.txt> -c <cache dir>')
         print('if -r option not supplied it will look for PWD environment variable')
         print('if -l option is not supplied, the default library file will be requirements.txt')
+        print('if -c option is not supplied, the cache is in $PYALEXASKILL_CACHE or ~/.cache/pyalexaskill')
+        print('-z <compression level 0-9, default 6> -j <number of compression processes, default the number of cpus>')
+        print('-x <comma separated exclude patterns> --keep <comma separated default patterns to keep> --no-slim')
+        print('--no-compile --strip-docstrings --target-python <python version of the lambda runtime, e.g. 3.11>')
+        print('--shake or --shake-modules --allow <comma separated module patterns> --verify -e <entry file, default main.py>')
         sys.exit(2)
     for opt, arg in opts:
         if opt == '-h':
@@ -221,6 +996,35 @@ def main(argv):
             include_files = arg.replace("'",'')
         elif opt in ("-l", "--libraries"):
             default_requirements_file_name = arg
+        elif opt in ("-c", "--cache"):
+            cache_dir = arg
+        elif opt in ("-z", "--compress-level"):
+            compress_level = int(arg)
+        elif opt in ("-j", "--jobs"):
+            workers = int(arg)
+        elif opt in ("-x", "--exclude"):
+            exclude_patterns.extend(pattern.strip() for pattern in arg.split(",") if pattern.strip())
+        elif opt == "--keep":
+            keep = set(pattern.strip() for pattern in arg.split(","))
+            exclude_patterns = [pattern for pattern in exclude_patterns if pattern not in keep]
+        elif opt == "--no-slim":
+            slim = False
+        elif opt == "--no-compile":
+            precompile = False
+        elif opt == "--strip-docstrings":
+            strip_docstrings = True
+        elif opt == "--target-python":
+            target_python = arg
+        elif opt == "--shake":
+            shake = shake or "packages"
+        elif opt == "--shake-modules":
+            shake = "modules"
+        elif opt == "--allow":
+            allow_patterns.extend(pattern.strip() for pattern in arg.split(",") if pattern.strip())
+        elif opt == "--verify":
+            verify = True
+        elif opt in ("-e", "--entry"):
+            entry_file = arg
 
     if not root_project_dir:
         root_project_dir = os.environ.get("PWD")
@@ -232,6 +1036,18 @@ def main(argv):
     if not include_files:
         raise ValueError("Must supply -i or --include option")
 
+    keep_paths = [include_file.strip().replace(os.path.sep, "/") for include_file in include_files.split(",")]
+    if verify:
+        if entry_file is None:
+            if "main.py" not in keep_paths:
+                print("ERROR: --verify needs the entry module, main.py is not included, use -e <entry file>")
+                sys.exit(2)
+            entry_file = "main.py"
+        entry_module = _module_name(entry_file.strip().replace(os.path.sep, "/"))
+        if entry_module is None:
+            print("ERROR: the entry file must be a python file: {0}".format(entry_file))
+            sys.exit(2)
+
     print(f"Using Library file: {default_requirements_file_name}")
 
     root_deployments_dir = os.path.join(root_project_dir, 'deployments')   #"{0}/deployments".format(root_project_dir)
@@ -257,6 +1073,36 @@ def main(argv):
     if install_requirements:
         _install_test_requirements(install_requirements, deployment_dir)
 
+    sizes_before = _package_sizes(deployment_dir)
+    # slimming removes the RECORD files that shaking uses to match .dist-info to packages
+    dist_info_top_levels = _all_dist_info_top_levels(deployment_dir) if shake else None
+    if slim:
+        removed = _slim_deployment(deployment_dir, exclude_patterns, keep_paths)
+        print("Removed {0} files matching the exclude patterns".format(len(removed)))
+
+    if shake:
+        roots = [path for path in keep_paths if path.endswith(".py")]
+        removed = _shake_deployment(deployment_dir, roots, allow_patterns, shake == "modules", dist_info_top_levels)
+        print("Removed {0} packages and modules that are not imported by {1}:".format(len(removed), ", ".join(roots)))
+        for rel_path in removed:
+            print("  {0}".format(rel_path))
+
+    if slim or shake:
+        if slim and precompile:
+            if target_python == "{0}.{1}".format(*sys.version_info[:2]):
+                compiled, failed = _precompile(deployment_dir, strip_docstrings)
+                print("Precompiled {0} python files, {1} could not be compiled".format(compiled, len(failed)))
+            else:
+                print("WARNING: not precompiling, the target python {0} is not the python running this script".format(target_python))
+        _print_size_report(sizes_before, _package_sizes(deployment_dir))
+
+    if verify:
+        if not _verify_deployment(deployment_dir, entry_module, allow_patterns):
+            print("ERROR: importing {0} from the deployment failed, the deployment directory is kept: {1}".format(
+                entry_module, deployment_dir))
+            sys.exit(1)
+        print("Verified: {0} imports from the deployment".format(entry_module))
+
 
     deployment_num_file_name = os.path.join(root_deployments_dir, '.deployment_number.txt') #"{0}/.deployment_number.txt".format(root_deployments_dir)
     if not os.path.isfile(deployment_num_file_name):
@@ -276,14 +1122,22 @@ def main(argv):
         deployment_zip_path = os.path.join(root_deployments_dir, "deployment_{0}.zip".format(next_deployment_number))
         while os.path.exists(deployment_dir_path) or os.path.exists(deployment_zip_path):
             next_deployment_number = next_deployment_number + 1
+            deployment_dir_path = os.path.join(root_deployments_dir, "deployment_{0}".format(next_deployment_number))
+            deployment_zip_path = os.path.join(root_deployments_dir, "deployment_{0}.zip".format(next_deployment_number))
 
         f.seek(0)
         f.write("{0}\n".format(next_deployment_number))
 
     deployment_zip_filename = os.path.join(root_deployments_dir, "deployment_{0}.zip".format(next_deployment_number))
-    zipdir(deployment_dir, deployment_zip_filename)
+    previous_zip_filename = _latest_deployment_zip(root_deployments_dir)
+    result = zipdir(deployment_dir, deployment_zip_filename, previousZipPath=previous_zip_filename,
+                    compressLevel=compress_level, workers=workers)
     shutil.rmtree(deployment_dir, ignore_errors=True)
     print("Created deployment zip file: {0}".format(deployment_zip_filename))
+    print("{0} files, {1} reused from the previous deployment, {2} compressed".format(
+        result['files'], result['reused'], result['compressed']))
+    if result['unchanged']:
+        print("The deployment is unchanged from {0}, the upload can be skipped".format(previous_zip_filename))
 
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -41,12 +41,16 @@ from {0} import {1}
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+#  The handler is created once, when the lambda container starts, and is
+#  reused by every warm invocation so anything it caches survives between
+#  requests.  warm_up() runs the handler's on_cold_start hook during init.
+deployment_handler = {1}()
+deployment_handler.warm_up()
 
-def lambda_handler(event, context):
-    logging.info("Executing main lambda_handler for {1} class")
 
-    deployment_handler = {1}()
+def lambda_handler(event, context):
     handler_response = deployment_handler.process_request(event, context)
+    logging.info("Executed main lambda_handler for {1} class, cold start: %s", deployment_handler.is_cold_start)
 
     return handler_response
 
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+import getopt
+import logging
+import os
+import sys
+
+from pyalexaskill import AlexaServer
+from pyalexaskill.AlexaRequestVerifier import AlexaRequestVerifier, FileCertificateFetcher
+
+"""
+Script to serve an Alexa handler class over HTTP(S) outside of AWS Lambda.
+
+The handler class is created once in each worker process, there is one worker
+process per core unless -w is supplied.
+
+run_alexa_server.py -c mymodule.MyHandler -p 8443 --cert cert.pem --key key.pem
+
+"""
+
+
+def _usage():
+    print('run_alexa_server.py -c <module.HandlerClass> [-r <root project dir>] [-H <host>] [-p <port>] [-w <workers>] [-a <app id>]')
+    print('                    [-q <listen queue size>] [-m <max concurrent connections per worker>] [--cert <certfile> --key <keyfile>]')
+    print('if -r option not supplied it will look for PWD environment variable, the handler module is imported from there')
+    print('if -w option not supplied there will be one worker process per core')
+    print('if --cert option not supplied the server uses plain HTTP, e.g. behind a TLS terminating proxy')
+    print('--verify checks the signature and timestamp of every request, --certdir reads the signing certificates from a local directory')
+
+
+def main(argv):
+    root_project_dir = ''
+    handler_path = ''
+    host = '0.0.0.0'
+    port = 8080
+    workers = None
+    app_id = None
+    request_queue_size = 128
+    max_concurrent = 64
+    certfile = None
+    keyfile = None
+    verify = False
+    cert_dir = None
+
+    try:
+        opts, args = getopt.getopt(argv, "hr:c:H:p:w:a:q:m:", ["root=", "classname=", "host=", "port=", "workers=",
+                                                               "appid=", "queue=", "maxconcurrent=", "cert=", "key=",
+                                                               "verify", "certdir="])
+    except getopt.GetoptError:
+        _usage()
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            _usage()
+            sys.exit()
+        elif opt in ("-r", "--root"):
+            root_project_dir = arg
+        elif opt in ("-c", "--classname"):
+            handler_path = arg
+        elif opt in ("-H", "--host"):
+            host = arg
+        elif opt in ("-p", "--port"):
+            port = int(arg)
+        elif opt in ("-w", "--workers"):
+            workers = int(arg)
+        elif opt in ("-a", "--appid"):
+            app_id = arg
+        elif opt in ("-q", "--queue"):
+            request_queue_size = int(arg)
+        elif opt in ("-m", "--maxconcurrent"):
+            max_concurrent = int(arg)
+        elif opt == "--cert":
+            certfile = arg
+        elif opt == "--key":
+            keyfile = arg
+        elif opt == "--verify":
+            verify = True
+        elif opt == "--certdir":
+            verify = True
+            cert_dir = arg
+
+    if not handler_path:
+        raise ValueError("Must supply -c or --classname option")
+
+    if not root_project_dir:
+        root_project_dir = os.environ.get("PWD")
+        if root_project_dir is None:
+            root_project_dir = os.getcwd()
+    sys.path.insert(0, root_project_dir)
+
+    logging.basicConfig(level=logging.INFO)
+
+    verifier = None
+    if verify:
+        verifier = AlexaRequestVerifier(fetcher=FileCertificateFetcher(cert_dir) if cert_dir else None)
+
+    handler_class = AlexaServer.load_handler_class(handler_path)
+    try:
+        AlexaServer.serve(handler_class, host=host, port=port, workers=workers, handler_args=(app_id,) if app_id else (),
+                          request_queue_size=request_queue_size, max_concurrent=max_concurrent,
+                          certfile=certfile, keyfile=keyfile, verifier=verifier)
+    except RuntimeError as exc:
+        print(exc)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
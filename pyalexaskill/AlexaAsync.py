@@ -0,0 +1,80 @@
+"""
+asyncio support for the handlers.  This module requires python 3.7 or later and
+is only imported by AlexaBaseHandler when one of the async methods is used, so
+the rest of the package keeps working on python 2.
+"""
+
+import asyncio
+import functools
+import inspect
+import traceback
+
+from pyalexaskill.AlexaBaseHandler import _NOT_ACKED
+
+
+async def _call(handler, route):
+    # on_ handlers can be either plain methods or coroutines
+    result = handler._call_route(route)
+    if inspect.isawaitable(result):
+        try:
+            result = await result
+        except Exception:
+            handler._log_call_error(route[0])
+            raise
+    return result
+
+
+async def process_request_async(handler, event, context):
+    """
+    Async version of AlexaBaseHandler.process_request.  The event goes through
+    the same route step as process_request, and the on_ handler is awaited if
+    it is a coroutine, so sync and async on_ handlers can be mixed in one class.
+
+    :param handler: AlexaBaseHandler instance
+    :param event:
+    :param context:
+    :return: response from the on_ handler
+    """
+    response = handler._begin_request(event)
+    if response is not _NOT_ACKED:
+        return response
+
+    started, previous_view = handler._start_event(event)
+    outcome = 'ok'
+
+    try:
+        view = handler._enter_event(event)
+        handler._check_event(event, True)
+        await _call(handler, handler._route_session_started(event, view))
+        response = await _call(handler, handler._route_event(event, context, view))
+
+    except Exception as exc:
+        outcome = 'error'
+        handler.logger.error("Error in process_request_async: %s", traceback.format_exc())
+        handler.logger.error("%s", exc)
+        response = handler.on_processing_error(event, context, exc)
+        if inspect.isawaitable(response):
+            response = await response
+
+    handler._finish_event(event, started, outcome, previous_view)
+    return response
+
+
+def gather(*calls):
+    """
+    Run several downstream calls at the same time inside one on_ handler.
+    :param calls: coroutines or futures
+    :return: awaitable of the list of results, in the order of the calls
+    """
+    return asyncio.gather(*calls)
+
+
+def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function, e.g. a boto3 call, on the default executor of the
+    running event loop so it can be awaited along with other calls.  Call it
+    from a coroutine, e.g. an async on_ handler.
+    :return: awaitable of the result of func
+    """
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
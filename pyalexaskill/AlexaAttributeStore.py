@@ -0,0 +1,179 @@
+import json
+import sqlite3
+import threading
+import time
+
+from pyalexaskill.AlexaCache import LRUCache
+
+"""
+Persistent attributes per Alexa user, for data that has to outlive a session,
+like favourites or playback positions.
+
+AttributeStore is the interface of a backend, SQLiteAttributeStore is the one
+that ships with the package and can stand in locally for a key value service.
+CachedAttributeStore puts an in-process, read-through LRU cache in front of a
+backend and batches the writes: put only changes the cache, and flush writes
+every pending change to the backend in one call, with a flush_interval only
+once that many seconds have passed since the last write.  AlexaBaseHandler
+flushes the store of the handler before process_request returns.
+
+Keep the store on a handler that is reused across warm invocations and the
+cache is reused too.
+"""
+
+
+class AttributeStore(object):
+    """
+    Interface for a persistent attribute backend
+    """
+
+    def get_many(self, user_ids):
+        """
+        :param user_ids: list of user ids
+        :return: dict of user id -> attributes dict, users without attributes are left out
+        """
+        raise NotImplementedError()
+
+    def put_many(self, items):
+        """
+        :param items: dict of user id -> attributes dict
+        :return: None
+        """
+        raise NotImplementedError()
+
+    def delete(self, user_id):
+        raise NotImplementedError()
+
+
+class SQLiteAttributeStore(AttributeStore):
+    """
+    Keeps the attributes as JSON in a SQLite table.
+
+    :param path: database file, ':memory:' for a database that lives as long as the store
+    :param table: table name
+    """
+
+    def __init__(self, path, table="user_attributes"):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS {0} (user_id TEXT PRIMARY KEY, attributes TEXT NOT NULL, updated REAL NOT NULL)".format(table))
+
+    def get_many(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        query = "SELECT user_id, attributes FROM {0} WHERE user_id IN ({1})".format(self.table, ",".join("?" * len(user_ids)))
+        with self._lock:
+            rows = self._connection.execute(query, user_ids).fetchall()
+        return dict((user_id, json.loads(attributes)) for user_id, attributes in rows)
+
+    def put_many(self, items):
+        if not items:
+            return
+        now = time.time()
+        rows = [(user_id, json.dumps(attributes, separators=(',', ':')), now) for user_id, attributes in items.items()]
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO {0} (user_id, attributes, updated) VALUES (?, ?, ?)".format(self.table), rows)
+
+    def delete(self, user_id):
+        with self._lock:
+            with self._connection:
+                self._connection.execute("DELETE FROM {0} WHERE user_id = ?".format(self.table), (user_id,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class CachedAttributeStore(object):
+    """
+    Read-through LRU cache with write-behind batching in front of an AttributeStore.
+
+    :param backend: AttributeStore
+    :param cache_size: number of users kept in the cache
+    :param cache_ttl: seconds a user is kept in the cache, None to keep users
+                      until they are evicted.  Set it when other processes
+                      write to the same backend.
+    :param flush_interval: minimum seconds between two writes to the backend,
+                           0, the default, to write at every flush
+    :param max_pending: number of changed users that are written regardless
+                        of flush_interval
+    """
+
+    def __init__(self, backend, cache_size=1024, cache_ttl=None, flush_interval=0.0, max_pending=256,
+                 clock=time.time):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._clock = clock
+        self._cache = LRUCache(cache_size, ttl=cache_ttl, clock=clock)
+        self._pending = {}
+        self._last_flush = clock()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        :param user_id:
+        :return: attributes dict of the user, an empty dict for a new user
+        """
+        with self._lock:
+            attributes = self._pending.get(user_id)
+        if attributes is not None:
+            return attributes
+
+        attributes = self._cache.get(user_id)
+        if attributes is None:
+            attributes = self.backend.get_many([user_id]).get(user_id, {})
+            self._cache.put(user_id, attributes)
+        return attributes
+
+    def put(self, user_id, attributes):
+        """
+        Change the attributes of a user.  Nothing is written to the backend
+        until flush is called.
+        """
+        self._cache.put(user_id, attributes)
+        with self._lock:
+            self._pending[user_id] = attributes
+
+    def delete(self, user_id):
+        with self._lock:
+            self._pending.pop(user_id, None)
+        self._cache.pop(user_id)
+        self.backend.delete(user_id)
+
+    @property
+    def has_pending(self):
+        return bool(self._pending)
+
+    def flush(self, force=False):
+        """
+        Write the pending changes to the backend in one batch, if flush_interval
+        has passed or max_pending is reached
+        :param force: write regardless of flush_interval and max_pending
+        :return: number of users written
+        """
+        if not self._pending:
+            return 0
+        now = self._clock()
+        if not force and len(self._pending) < self.max_pending and now - self._last_flush < self.flush_interval:
+            return 0
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._last_flush = now
+        try:
+            self.backend.put_many(pending)
+        except:
+            # keep the changes so the next flush retries them, unless they were changed again since
+            with self._lock:
+                for user_id, attributes in pending.items():
+                    self._pending.setdefault(user_id, attributes)
+            raise
+        return len(pending)
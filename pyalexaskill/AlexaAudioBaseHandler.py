@@ -1,5 +1,10 @@
-from pyalexaskill.AlexaBaseHandler import AlexaBaseHandler
+from pyalexaskill.AlexaBaseHandler import AlexaBaseHandler, _NOT_ACKED
+from pyalexaskill import AlexaResponse
+from pyalexaskill.AlexaCache import LRUCache
+from pyalexaskill.AlexaPlaybackStats import SKIPPED
+from pyalexaskill.AlexaPlaylist import PlaybackQueue, TOKEN_SEPARATOR
 import logging
+import traceback
 
 
 class AlexaAudioBaseHandler(AlexaBaseHandler):
@@ -25,10 +30,46 @@ class AlexaAudioBaseHandler(AlexaBaseHandler):
     earlier (Play, Stop and ClearQueue). The response should not include any of the 
     standard properties such as outputSpeech, just like the AudioPlayer directives.
 
+    To play from a playlist set self.playlist to an AlexaPlaylist.Playlist, get
+    the queue of the user with get_queue and create the directives with
+    create_queue_play_directive and create_queue_enqueue_directive.  The state
+    of the queue travels in the stream token and in the session attributes.
+
+    The handler records where playback was stopped or paused, in position_store
+    if it has one, and the Resume intent and the play command continue from there.
+    Resuming needs a playlist or an overridden create_resume_directive, without
+    them the play command is ignored and the Resume intent is not implemented,
+    as before these handlers were built in.  These built-in handlers can be
+    overridden like any other on_ method.
+
+    Stream urls of playlist tracks go through stream_resolver, if the handler has
+    one, and are cached until they expire.  The built-in PlaybackStarted handler
+    resolves the url of the next track, so PlaybackNearlyFinished only looks it up.
+
+    With playback_stats set, the playback requests and the Next intent are
+    counted per track, including requests answered by fast_ack_requests.
+
     """
 
-    def __init__(self, app_id=None, log_level=logging.INFO):
+    # session attribute with the state of the playback queue
+    queue_attribute = "playback_queue"
+
+    # seconds before it expires that a resolved stream url is no longer used
+    stream_url_expiry_margin = 60
+
+    def __init__(self, app_id=None, log_level=logging.INFO, playlist=None):
         super(AlexaAudioBaseHandler, self).__init__(app_id, log_level)
+        # optional AlexaPlaylist.Playlist used by the queue methods
+        self.playlist = playlist
+        # optional AlexaPositionStore.PositionStore for the resume positions
+        self.position_store = None
+        # optional callable(track) that returns the stream url of a track, or a
+        # tuple (url, expires_at) for urls that expire, e.g. signed urls
+        self.stream_resolver = None
+        # track key -> resolved stream url
+        self.stream_url_cache = LRUCache(1024)
+        # optional AlexaPlaybackStats.PlaybackStats for listening metrics
+        self.playback_stats = None
 
     def create_clearqueue_directive(self):
         directive = {
@@ -97,7 +138,7 @@ class AlexaAudioBaseHandler(AlexaBaseHandler):
         }
 
         if session_attributes is not None:
-            directive['sessionAttributes'] = session_attributes
+            directive['sessionAttributes'] = self._encode_session_attributes(session_attributes)
 
         return directive
 
@@ -127,7 +168,7 @@ class AlexaAudioBaseHandler(AlexaBaseHandler):
         }
 
         if session_attributes is not None:
-            directive['sessionAttributes'] = session_attributes
+            directive['sessionAttributes'] = self._encode_session_attributes(session_attributes)
 
         if speech_content is not None:
             directive['response']['outputSpeech']['type']="PlainText"
@@ -140,3 +181,223 @@ class AlexaAudioBaseHandler(AlexaBaseHandler):
 
         return directive
 
+    # --------------- JSON bytes versions of the directives ----------------------
+    # These return the final JSON bytes of the response, see AlexaResponse.
+    def create_clearqueue_directive_json(self):
+        return AlexaResponse.CLEAR_QUEUE_RESPONSE
+
+    def create_stop_directive_json(self):
+        return AlexaResponse.STOP_RESPONSE
+
+    def create_empty_response_json(self):
+        return AlexaResponse.EMPTY_RESPONSE
+
+    def create_enqueue_directive_json(self, current_token, token, url, session_attributes=None):
+        return AlexaResponse.enqueue_directive(current_token, token, url, self._encode_session_attributes(session_attributes))
+
+    def create_play_directive_json(self, token, url, behavior="REPLACE_ALL", offset=0, speech_content=None, card_title=None, card_content=None, session_attributes=None):
+        return AlexaResponse.play_directive(token, url, behavior, offset, speech_content, card_title, card_content,
+                                           self._encode_session_attributes(session_attributes))
+
+    # --------------- playback queue ----------------------
+    def _current_view(self, session=None):
+        # the view of the event being processed, if it is the event of the session
+        view = self._event_view
+        if view is None or (session is not None and view.raw.get('session') is not session):
+            return None
+        return view
+
+    def get_queue(self, session=None, token=None):
+        """
+        Restore the playback queue of the user from, in this order, the token,
+        the stream the AudioPlayer of the device is on and the session attributes.
+
+        :param session: session of an intent request
+        :param token: stream token, e.g. event['request']['token'] of an AudioPlayer event
+        :return: AlexaPlaylist.PlaybackQueue, at the start of the playlist if no state was found
+        """
+        if self.playlist is None:
+            raise ValueError("The handler has no playlist")
+
+        view = self._current_view(session)
+        for state in (token, view.audio_player_token if view is not None else None):
+            queue = PlaybackQueue.from_state(self.playlist, state)
+            if queue is not None:
+                return queue
+        if session is not None:
+            queue = PlaybackQueue.from_state(self.playlist, self._get_session_overlay(session).get(self.queue_attribute))
+            if queue is not None:
+                return queue
+        return PlaybackQueue(self.playlist)
+
+    def get_audio_player_offset(self, session=None):
+        """
+        :return: offsetInMilliseconds of the AudioPlayer of the device, 0 if unknown
+        """
+        view = self._current_view(session)
+        return (view.audio_player_offset if view is not None else None) or 0
+
+    def create_queue_play_directive(self, queue, behavior="REPLACE_ALL", offset=0, speech_content=None, card_title=None, card_content=None, session_attributes=None):
+        """
+        Play directive for the current track of the queue
+        """
+        session_attributes = dict(session_attributes) if session_attributes else {}
+        session_attributes[self.queue_attribute] = queue.state()
+        return self.create_play_directive(queue.stream_token(), self.resolve_stream_url(queue.current()), behavior, offset,
+                                          speech_content, card_title, card_content, session_attributes)
+
+    def create_queue_enqueue_directive(self, queue, current_token):
+        """
+        Enqueue directive for the current track of the queue, call queue.next(automatic=True) first
+        """
+        return self.create_enqueue_directive(current_token, queue.stream_token(), self.resolve_stream_url(queue.current()))
+
+    # --------------- stream urls ----------------------
+    def resolve_stream_url(self, track):
+        """
+        :param track: track dict
+        :return: stream url of the track, from stream_url_cache or stream_resolver,
+                 track['url'] if the handler has no stream_resolver
+        """
+        if self.stream_resolver is None:
+            return track['url']
+
+        key = track.get('token') or track.get('url')
+        url = self.stream_url_cache.get(key)
+        if url is None:
+            resolved = self.stream_resolver(track)
+            expires_at = None
+            if isinstance(resolved, tuple):
+                resolved, expires_at = resolved
+                if expires_at is not None:
+                    expires_at -= self.stream_url_expiry_margin
+            url = resolved
+            self.stream_url_cache.put(key, url, expires_at)
+        return url
+
+    def prefetch_next(self, queue):
+        """
+        Resolve the stream url of the track after the current track of the queue,
+        so it is in stream_url_cache when the enqueue directive is created
+        :return: the next track, or None at the end of the queue
+        """
+        track = queue.peek_next(automatic=True)
+        if track is not None and self.stream_resolver is not None:
+            try:
+                self.resolve_stream_url(track)
+            except Exception:
+                # the url is resolved again when the track is enqueued
+                self.logger.error("Error prefetching stream url: %s", traceback.format_exc())
+        return track
+
+    def on_audioplayer_playbackstarted(self, event, context):
+        if self.playlist is not None:
+            self.prefetch_next(self.get_queue(token=self._view_of(event).request.token))
+        return None
+
+    # --------------- resume positions ----------------------
+    def _record_position(self, view, token, offset):
+        if self.position_store is not None and view is not None:
+            self.position_store.record(view.user_id, token, offset)
+
+    def create_resume_directive(self, token, offset):
+        """
+        Play directive that continues the stream with the token at the offset.
+        Uses the playlist, handlers without a playlist have to override it.
+        :param token: stream token, None if nothing was played before
+        :param offset: offset in milliseconds
+        """
+        if self.playlist is None:
+            raise NotImplementedError("create_resume_directive needs a playlist")
+        queue = PlaybackQueue.from_state(self.playlist, token)
+        if queue is None:
+            queue = PlaybackQueue(self.playlist)
+            if queue.jump_to(token) is None:
+                offset = 0
+        return self.create_queue_play_directive(queue, offset=offset or 0)
+
+    def _can_resume(self):
+        return self.playlist is not None or \
+            self.__class__.create_resume_directive != AlexaAudioBaseHandler.create_resume_directive
+
+    def _resume(self, view):
+        position = None
+        if self.position_store is not None and view is not None:
+            position = self.position_store.get(view.user_id)
+        if position is not None:
+            return self.create_resume_directive(position.token, position.offset)
+        if view is not None:
+            return self.create_resume_directive(view.audio_player_token, view.audio_player_offset)
+        return self.create_resume_directive(None, 0)
+
+    def on_audioplayer_playbackstopped(self, event, context):
+        request = self._view_of(event).request
+        self._record_position(self._view_of(event), request.token, request.offset)
+        return None
+
+    def on_playbackcontroller_pausecommandissued(self, event, context):
+        view = self._view_of(event)
+        self._record_position(view, view.audio_player_token, view.audio_player_offset)
+        return self.create_stop_directive()
+
+    def on_playbackcontroller_playcommandissued(self, event, context):
+        if not self._can_resume():
+            return None
+        return self._resume(self._view_of(event))
+
+    def on_pause_intent(self, intent_request, session):
+        view = self._current_view(session)
+        if view is not None:
+            self._record_position(view, view.audio_player_token, view.audio_player_offset)
+        return self.create_stop_directive()
+
+    def on_resume_intent(self, intent_request, session):
+        if not self._can_resume():
+            raise NotImplementedError("No method with name: on_resume_intent exists in class")
+        return self._resume(self._current_view(session))
+
+    # --------------- playback metrics ----------------------
+    def _track_key(self, token):
+        """
+        :return: track token of a stream token, without the queue state
+        """
+        if token is None:
+            return None
+        if self.playlist is not None:
+            position = self.playlist.position_of(token)
+            if position is not None:
+                return self.playlist.track_token(position)
+        return token.rpartition(TOKEN_SEPARATOR)[0] or token
+
+    def _count_playback_request(self, event):
+        request = event.get('request') or {}
+        token = request.get('token')
+        if token is None:
+            try:
+                token = event['context']['AudioPlayer'].get('token')
+            except (KeyError, TypeError, AttributeError):
+                return
+        self.playback_stats.record_request(request.get('type'), self._track_key(token))
+
+    def _fast_ack(self, event):
+        response = super(AlexaAudioBaseHandler, self)._fast_ack(event)
+        if response is not _NOT_ACKED and self.playback_stats is not None:
+            self._count_playback_request(event)
+        return response
+
+    def _route_amazon_request(self, event, context):
+        if self.playback_stats is not None:
+            self._count_playback_request(event)
+        return super(AlexaAudioBaseHandler, self)._route_amazon_request(event, context)
+
+    def _route_amazon_intent(self, event, context):
+        if self.playback_stats is not None and self._get_intent_name(event['request']) == "AMAZON.NextIntent":
+            view = self._view_of(event)
+            self.playback_stats.record(self._track_key(view.audio_player_token), SKIPPED)
+        return super(AlexaAudioBaseHandler, self)._route_amazon_intent(event, context)
+
+    def _flush_pending_writes(self):
+        super(AlexaAudioBaseHandler, self)._flush_pending_writes()
+        if self.playback_stats is not None:
+            self.playback_stats.flush()
+        self._flush_store(self.position_store)
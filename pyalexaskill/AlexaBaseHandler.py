@@ -1,9 +1,189 @@
 import abc
 import logging
+import threading
 import traceback
 
+try:
+    from contextvars import ContextVar
+except ImportError:
+    ContextVar = None
+
+from pyalexaskill import AlexaResponse
+from pyalexaskill.AlexaEvent import Event, Request, Session
+from pyalexaskill.AlexaRequestLog import AlexaRequestLog
+from pyalexaskill.AlexaSessionOverlay import SessionOverlay
+
+# Request types and built in intents that Alexa is known to send.  The routes
+# for these are resolved when a handler class is defined so the first request
+# of each kind does not pay for the resolution either.
+KNOWN_REQUEST_TYPES = (
+    "LaunchRequest",
+    "SessionEndedRequest",
+    "AudioPlayer.PlaybackStarted",
+    "AudioPlayer.PlaybackFinished",
+    "AudioPlayer.PlaybackStopped",
+    "AudioPlayer.PlaybackNearlyFinished",
+    "AudioPlayer.PlaybackFailed",
+    "PlaybackController.NextCommandIssued",
+    "PlaybackController.PauseCommandIssued",
+    "PlaybackController.PlayCommandIssued",
+    "PlaybackController.PreviousCommandIssued",
+    "System.ExceptionEncountered",
+)
+
+KNOWN_AMAZON_INTENTS = (
+    "AMAZON.CancelIntent",
+    "AMAZON.HelpIntent",
+    "AMAZON.LoopOffIntent",
+    "AMAZON.LoopOnIntent",
+    "AMAZON.NextIntent",
+    "AMAZON.NoIntent",
+    "AMAZON.PauseIntent",
+    "AMAZON.PreviousIntent",
+    "AMAZON.RepeatIntent",
+    "AMAZON.ResumeIntent",
+    "AMAZON.ShuffleOffIntent",
+    "AMAZON.ShuffleOnIntent",
+    "AMAZON.StartOverIntent",
+    "AMAZON.StopIntent",
+    "AMAZON.YesIntent",
+)
+
+
+# returned by _fast_ack for events that need the full dispatch
+_NOT_ACKED = object()
+
+# routes that do not go to a method of their own, e.g. unknown request types or
+# custom intents that fall back to on_intent, are only kept while a route table
+# is smaller than this, so requests with made up names cannot grow it forever
+MAX_FALLBACK_ROUTES = 256
+
+
+class AlexaHandlerMeta(abc.ABCMeta):
+    """
+    Metaclass for the handlers.  When a handler class is defined it collects
+    the on_ methods of the class and resolves the routes for the known request
+    types and intents, so process_request does not have to build method
+    names and reflect on the handler for every request.
+
+    Routes for request types or intents that are not known up front are
+    resolved the first time they are seen and kept in the same table, routes
+    without an on_ method of their own only up to MAX_FALLBACK_ROUTES.
+    """
+
+    def __init__(cls, name, bases, namespace):
+        super(AlexaHandlerMeta, cls).__init__(name, bases, namespace)
+        cls._handler_method_names = frozenset(attr for attr in dir(cls) if attr.startswith("on_"))
+        cls._request_routes = {}
+        cls._intent_routes = {}
+        for request_type in KNOWN_REQUEST_TYPES:
+            cls._resolve_request_route(request_type)
+        for intent_name in KNOWN_AMAZON_INTENTS:
+            cls._resolve_intent_route(intent_name)
+
+    def _resolve_request_route(cls, request_type):
+        """
+        Resolve the on_ method name for a request type of the form A or A.B,
+        e.g. AudioPlayer.PlaybackStarted -> on_audioplayer_playbackstarted
+
+        :param request_type: raw request.type from the event
+        :return: (method_name, found) where found is False if the class has no such method
+        """
+        try:
+            return cls._request_routes[request_type]
+        except KeyError:
+            pass
+
+        parts = request_type.split(".")
+        if len(parts) == 1:
+            method_name = "on_{0}".format(parts[0].lower())
+        elif len(parts) == 2:
+            method_name = "on_{0}_{1}".format(parts[0].lower(), parts[1].lower())
+        else:
+            raise NotImplementedError("Unexpected request type: {0}".format(request_type))
+
+        found = method_name in cls._handler_method_names
+        route = (method_name, found)
+        if found or len(cls._request_routes) < MAX_FALLBACK_ROUTES:
+            cls._request_routes[request_type] = route
+        return route
 
-class AlexaBaseHandler(object):
+    def _resolve_intent_route(cls, intent_name):
+        """
+        Resolve the on_ method name for an intent.  AMAZON built in intents
+        map to on_<name without Intent>_intent, custom intents map to
+        on_<name>_intent and fall back to on_intent.
+
+        :param intent_name: raw intent name from the event
+        :return: (method_name, target) where target is the method to call, or
+                 None if there is no method to handle the intent
+        """
+        try:
+            return cls._intent_routes[intent_name]
+        except KeyError:
+            pass
+
+        if intent_name.startswith("AMAZON."):
+            method_name = "on_{0}_intent".format(intent_name.split(".")[1].replace("Intent", "").lower())
+            fallback = None
+        else:
+            method_name = "on_{0}_intent".format(intent_name.lower())
+            fallback = "on_intent"
+
+        if method_name in cls._handler_method_names:
+            target = method_name
+        elif fallback in cls._handler_method_names:
+            target = fallback
+        else:
+            target = None
+
+        route = (method_name, target)
+        if target == method_name or len(cls._intent_routes) < MAX_FALLBACK_ROUTES:
+            cls._intent_routes[intent_name] = route
+        return route
+
+
+class _CurrentEventView(object):
+    """
+    The Event view of the event being processed.  One handler processes
+    requests in several threads at once in AlexaServer, and in several asyncio
+    tasks with process_request_async, so the view is kept per thread, and per
+    task where contextvars is available, instead of on the handler.
+    """
+
+    def __init__(self):
+        if ContextVar is not None:
+            self._var = ContextVar("pyalexaskill_event_view", default=None)
+        else:
+            self._var = None
+            self._local = threading.local()
+
+    def get(self):
+        if self._var is not None:
+            return self._var.get()
+        return getattr(self._local, 'view', None)
+
+    def set(self, view):
+        """
+        :return: the previous view, to restore when the event is processed
+        """
+        previous = self.get()
+        if self._var is not None:
+            self._var.set(view)
+        else:
+            self._local.view = view
+        return previous
+
+
+_current_event_view = _CurrentEventView()
+
+
+def _with_metaclass(meta, *bases):
+    # python 2 and 3 compatible way to declare the metaclass
+    return meta("AlexaHandlerBase", bases, {})
+
+
+class AlexaBaseHandler(_with_metaclass(AlexaHandlerMeta, object)):
     """
     Base class for a python Alexa Skill Set.  Concrete implementations
     are expected to implement the abstract methods.
@@ -12,12 +192,32 @@ class AlexaBaseHandler(object):
     https://developer.amazon.com/public/solutions/alexa/alexa-skills-kit/docs/handling-requests-sent-by-alexa
     """
 
-    __metaclass__ = abc.ABCMeta
-
-    def __init__(self, app_id=None, log_level=logging.INFO):
-        self.logger = logging.getLogger()
-        self.logger.setLevel(log_level)
+    # request type -> constant response (or None) returned for those requests
+    # without dispatching them, e.g. {"AudioPlayer.PlaybackFinished": None}.
+    # Only the app id is checked.  The responses are returned as is, not copied.
+    fast_ack_requests = {}
+
+    def __init__(self, app_id=None, log_level=logging.INFO, request_log_sample_rate=0.0):
+        # use the package logger, leaving the root logger configuration to
+        # the application.
+        self.logger = logging.getLogger("pyalexaskill")
+        if self.logger.level != log_level:
+            self.logger.setLevel(log_level)
         self.app_id = app_id
+        # structured per request log lines, see AlexaRequestLog
+        self.request_log = AlexaRequestLog(sample_rate=request_log_sample_rate)
+        # method name -> bound method, filled in as routes are used
+        self._bound_handlers = {}
+        # request types without an on_ method that have been logged
+        self._unhandled_request_types = set()
+        # optional AlexaSessionCodec.SessionCodec to pack the session attributes
+        self.session_codec = None
+        # optional AlexaAttributeStore.CachedAttributeStore for attributes per user
+        self.attribute_store = None
+        # lifecycle of the handler across warm lambda invocations
+        self.invocation_count = 0
+        self.is_cold_start = True
+        self._warmed_up = False
 
     @abc.abstractmethod
     def on_processing_error(self, event, context, exc):
@@ -44,22 +244,40 @@ class AlexaBaseHandler(object):
         pass
 
 
+    def on_cold_start(self):
+        """
+        Called once per handler instance before the first request is processed,
+        or when warm_up is called from the module that creates the handler.
+        Override to do expensive setup, e.g. load indexes or open connections,
+        that should be reused by every warm invocation of the lambda function.
+        :return: None
+        """
+        pass
+
+    def warm_up(self):
+        """
+        Run the on_cold_start hook if it has not been run yet.  Call this at
+        module level, next to where the handler is created, so the setup
+        happens during the lambda init phase instead of in the first request.
+        :return: None
+        """
+        if not self._warmed_up:
+            self._warmed_up = True
+            self.on_cold_start()
+
     def check_app_id(self, event):
         """
         Check the App id to make sure it is valid.
         :param event:
         :return: True - app id is valid, False - app id is invalid
         """
-        valid_app_id = False
+        if not self.app_id:
+            return True
+
         try:
-            if self.app_id and event['session']['application']['applicationId'] != self.app_id:
-                valid_app_id = False
-            else:
-                valid_app_id = True
+            return self._view_of(event).application_id == self.app_id
         except:
-            valid_app_id = False
-
-        return valid_app_id
+            return False
 
     def _handle_amazon_request(self, event, context):
         """
@@ -79,34 +297,7 @@ class AlexaBaseHandler(object):
         :param context:
         :return:speechlet_response, directive, None
         """
-        response = None
-        self.logger.debug("_handle_amazon_request: event: {0}".format(event))
-        request_type = event['request']['type']
-        self.logger.debug("_handle_amazon_request: {0}".format(request_type))
-        if request_type:
-            parts = request_type.split(".")
-            if len(parts) == 1:
-                request_type_method_name = "on_{0}".format(parts[0].lower())
-            elif len(parts) == 2:
-                request_type_method_name = "on_{0}_{1}".format(parts[0].lower(), parts[1].lower())
-            else:
-                raise NotImplementedError("Unexpected request type: {0}".format(request_type))
-
-            self.logger.debug("_handle_amazon_request: {0}".format(request_type_method_name))
-            if hasattr(self, request_type_method_name):
-                try:
-                    response = getattr(self, request_type_method_name)(event, context)
-                except:
-                    self.logger.error("Traceback Exception {0}".format(traceback.format_exc()))
-                    self.logger.error("ERROR: _handle_amazon_request: {0}".format(request_type_method_name))
-                    raise
-            else:
-                # not every request is required to be implemented - particularly for the
-                # playbackcontroller requests
-                self.logger.warn("_handle_amazon_request: {0} method not found".format(request_type_method_name))
-                #raise NotImplementedError("No method with name: {0} exists in class".format(request_type_method_name))
-
-        return response
+        return self._call_route(self._route_amazon_request(event, context))
 
     def _handle_amazon_intent(self, event, context):
         """
@@ -122,25 +313,7 @@ class AlexaBaseHandler(object):
         :param context:
         :return: speechlet_response
         """
-        response = None
-
-        intent_name = self._get_intent_name(event['request'])
-        if intent_name is not None and intent_name.startswith("AMAZON."):
-            intent_method_name = "on_{0}_intent".format(intent_name.split(".")[1].replace("Intent","").lower())
-            self.logger.debug("_handle_amazon_intent: {0}".format(intent_method_name))
-
-            if hasattr(self, intent_method_name):
-                try:
-                    response = getattr(self, intent_method_name)(event['request'], event['session'])
-                except:
-                    self.logger.error("Traceback Exception {0}".format(traceback.format_exc()))
-                    self.logger.error("ERROR: _handle_amazon_intent: {0}".format(intent_method_name))
-                    raise
-
-            else:
-                raise NotImplementedError("No method with name: {0} exists in class".format(intent_method_name))
-
-        return response
+        return self._call_route(self._route_amazon_intent(event, context))
 
     def _handle_custom_intent(self, event, context):
         """
@@ -160,32 +333,156 @@ class AlexaBaseHandler(object):
         :param context:
         :return: speechlet_response
         """
-        response = None
+        return self._call_route(self._route_custom_intent(event, context))
+
+    # --------------- Dispatch, route step and call step ----------------------
+    # The route step finds the on_ method for an event, the call step calls it.
+    # process_request and process_request_async share the route step and only
+    # differ in awaiting the result of the call step, so override the _route_
+    # methods to change how events are dispatched by both.
+    def _route_amazon_request(self, event, context):
+        """
+        Route step of _handle_amazon_request
+        :return: (method_name, target, args) to pass to _call_route, or None if
+                 the request type has no on_ method
+        """
+        self.logger.debug("_handle_amazon_request: event: %s", event)
+        request_type = event['request']['type']
+        self.logger.debug("_handle_amazon_request: %s", request_type)
+        if not request_type:
+            return None
 
+        request_type_method_name, found = self.__class__._resolve_request_route(request_type)
+        self.logger.debug("_handle_amazon_request: %s", request_type_method_name)
+        if found:
+            return request_type_method_name, request_type_method_name, (event, context)
+
+        if request_type not in self._unhandled_request_types:
+            # not every request is required to be implemented - particularly for the
+            # playbackcontroller requests.  Warn once per request type.
+            if len(self._unhandled_request_types) < MAX_FALLBACK_ROUTES:
+                self._unhandled_request_types.add(request_type)
+            self.logger.warning("_handle_amazon_request: %s method not found", request_type_method_name)
+        return None
+
+    def _route_amazon_intent(self, event, context):
+        """
+        Route step of _handle_amazon_intent
+        :return: (method_name, target, args) to pass to _call_route, or None
+        """
         intent_name = self._get_intent_name(event['request'])
-        if intent_name is not None:
-            intent_method_name = "on_{0}_intent".format(intent_name.lower())
-            self.logger.debug("_handle_custom_intent: {0}".format(intent_method_name))
-
-            if hasattr(self, intent_method_name):
-                try:
-                    response = getattr(self, intent_method_name)(event['request'], event['session'])
-                except:
-                    self.logger.error("Traceback Exception {0}".format(traceback.format_exc()))
-                    self.logger.error("ERROR: _handle_amazon_intent: {0}".format(intent_method_name))
-                    raise
-
-            elif hasattr(self, 'on_intent'):
-                try:
-                    response = getattr(self, 'on_intent')(event['request'], event['session'])
-                except:
-                    self.logger.error("Traceback Exception {0}".format(traceback.format_exc()))
-                    self.logger.error("ERROR: _handle_custom_intent: {0}".format(intent_method_name))
-                    raise
-            else:
-                raise NotImplementedError("No method with name: {0} exists in class".format(intent_method_name))
+        if intent_name is None or not intent_name.startswith("AMAZON."):
+            return None
+        return self._intent_route(intent_name, event, "_handle_amazon_intent")
 
-        return response
+    def _route_custom_intent(self, event, context):
+        """
+        Route step of _handle_custom_intent
+        :return: (method_name, target, args) to pass to _call_route, or None
+        """
+        intent_name = self._get_intent_name(event['request'])
+        if intent_name is None:
+            return None
+        return self._intent_route(intent_name, event, "_handle_custom_intent")
+
+    def _intent_route(self, intent_name, event, caller):
+        intent_method_name, target = self.__class__._resolve_intent_route(intent_name)
+        self.logger.debug("%s: %s", caller, intent_method_name)
+        if target is None:
+            raise NotImplementedError("No method with name: {0} exists in class".format(intent_method_name))
+        return intent_method_name, target, (event['request'], event['session'])
+
+    def _route_event(self, event, context, view):
+        """
+        Route step for any event, see _route_amazon_request
+        :param view: Event view of the event
+        """
+        request = view.request
+        if request.type == "IntentRequest":
+            # Only handle IntentRequest here... all others in the else block
+            intent_name = request.intent_name
+            if intent_name is not None and intent_name.startswith("AMAZON."):
+                return self._route_amazon_intent(event, context)
+            # this is a user specific intent, so let the users concrete
+            # implementation handle it.
+            return self._route_custom_intent(event, context)
+
+        # LaunchRequest, SessionEndedRequest, AudioPlayer requests, etc
+        # are handled here.
+        return self._route_amazon_request(event, context)
+
+    def _route_session_started(self, event, view):
+        """
+        Route step for on_session_started, when the event starts a new session
+        :return: (method_name, target, args), or None
+        """
+        session = view.session
+        if session is not None and session.new is not False and 'on_session_started' in self._handler_method_names:
+            return 'on_session_started', 'on_session_started', (event['request'], event['session'])
+        return None
+
+    def _call_route(self, route):
+        """
+        Call step: call the on_ method of a route.  For an async on_ method
+        this returns the coroutine, which process_request_async awaits.
+        :param route: (method_name, target, args) from a _route_ method, or None
+        :return: result of the on_ method, None if route is None
+        """
+        if route is None:
+            return None
+        method_name, target, args = route
+        try:
+            return self._bound_handler(target)(*args)
+        except:
+            self._log_call_error(method_name)
+            raise
+
+    def _log_call_error(self, method_name):
+        # called from an except block, for sync on_ methods and awaited coroutines alike
+        self.logger.error("Traceback Exception {0}".format(traceback.format_exc()))
+        self.logger.error("ERROR: calling {0}".format(method_name))
+
+    def _fast_ack(self, event):
+        """
+        Minimal check for the request types in fast_ack_requests
+        :param event:
+        :return: the constant response for the request type, or _NOT_ACKED if
+                 the event needs the full dispatch
+        """
+        try:
+            request_type = event['request']['type']
+        except (KeyError, TypeError):
+            return _NOT_ACKED
+        if request_type not in self.fast_ack_requests:
+            return _NOT_ACKED
+
+        if self.__class__.check_app_id != AlexaBaseHandler.check_app_id:
+            if not self.check_app_id(event):
+                return _NOT_ACKED
+        elif self.app_id:
+            # AudioPlayer and PlaybackController requests only have the app id in the context
+            try:
+                application_id = event['context']['System']['application']['applicationId']
+            except (KeyError, TypeError):
+                return _NOT_ACKED
+            if application_id != self.app_id:
+                return _NOT_ACKED
+
+        return self.fast_ack_requests[request_type]
+
+    def _bound_handler(self, method_name):
+        """
+        Return the bound on_ method for a resolved route, binding it only
+        the first time it is used by this handler instance.
+        :param method_name:
+        :return: bound method
+        """
+        try:
+            return self._bound_handlers[method_name]
+        except KeyError:
+            handler = getattr(self, method_name)
+            self._bound_handlers[method_name] = handler
+            return handler
 
     #--------------------------------------------------------
     #--------------- Main Processing Entry Point  -----------
@@ -198,53 +495,157 @@ class AlexaBaseHandler(object):
         :param context:
         :return: response from the on_ handler
         """
-        self.logger.debug("process_request: event: {0}".format(event))
+        response = self._begin_request(event)
+        if response is not _NOT_ACKED:
+            return response
 
-        try:
-            request_type = event['request']['type']
-            self.logger.debug("event[request][type]: {0}".format(request_type))
-        except:
-            request_type = None
+        return self._process_event(event, context, True)
 
-        try:
-            new_session = event['session']['new']
-        except:
-            new_session = False
+    def _begin_request(self, event):
+        """
+        Count the invocation, warm up the handler on the first one and answer
+        the fast_ack_requests
+        :return: the fast ack response, or _NOT_ACKED if the event needs the full dispatch
+        """
+        self.invocation_count += 1
+        self.is_cold_start = self.invocation_count == 1
+        if not self._warmed_up:
+            self.warm_up()
+
+        if self.fast_ack_requests:
+            return self._fast_ack(event)
+        return _NOT_ACKED
+
+    def process_requests(self, events, context):
+        """
+        Process many Alexa requests in one call, for example to replay captured
+        traffic through a handler.  The handler is warmed up and it is decided
+        if the app id needs to be checked once, before the first event, and
+        then each event is dispatched exactly like process_request would.
+
+        :param events: iterable of Alexa events
+        :param context: context passed to every on_ handler
+        :return: generator of the responses, in the order of the events
+        """
+        if not self._warmed_up:
+            self.warm_up()
+
+        # without an app id the default check_app_id accepts every event
+        check_app_id = bool(self.app_id) or self.__class__.check_app_id != AlexaBaseHandler.check_app_id
+        process_event = self._process_event
+        fast_ack = self._fast_ack if self.fast_ack_requests else None
+        for event in events:
+            self.invocation_count += 1
+            self.is_cold_start = self.invocation_count == 1
+            if fast_ack is not None:
+                response = fast_ack(event)
+                if response is not _NOT_ACKED:
+                    yield response
+                    continue
+            yield process_event(event, context, check_app_id)
+
+    def process_request_async(self, event, context):
+        """
+        Awaitable version of process_request.  on_ handlers may be written as
+        coroutines (async def) and are awaited, plain on_ handlers are called
+        as usual.  Requires python 3.7 or later, for example:
+
+        response = asyncio.run(handler.process_request_async(event, context))
+
+        :param event:
+        :param context:
+        :return: coroutine with the response from the on_ handler
+        """
+        from pyalexaskill import AlexaAsync
+        return AlexaAsync.process_request_async(self, event, context)
+
+    def gather(self, *calls):
+        """
+        Helper for async on_ handlers to wait on several downstream calls at once
+        results = await self.gather(get_schedule(), get_alerts())
+        :param calls: coroutines or futures
+        :return: awaitable of the list of results
+        """
+        from pyalexaskill import AlexaAsync
+        return AlexaAsync.gather(*calls)
+
+    def run_blocking(self, func, *args, **kwargs):
+        """
+        Helper for async on_ handlers to await a blocking call, which is run
+        on the executor of the event loop
+        :return: awaitable of the result of func
+        """
+        from pyalexaskill import AlexaAsync
+        return AlexaAsync.run_blocking(func, *args, **kwargs)
+
+    def _process_event(self, event, context, check_app_id):
+        """
+        Dispatch a single event to the appropriate on_ handler
+        :param event:
+        :param context:
+        :param check_app_id: False if the app id check is known to pass
+        :return: response from the on_ handler
+        """
+        started, previous_view = self._start_event(event)
+        outcome = 'ok'
 
-        # if its a new session, run the new session code
         try:
-            if not self.check_app_id(event):
-                raise NotImplementedError("Invalid Application ID")
+            view = self._enter_event(event)
+            self._check_event(event, check_app_id)
 
-            response = None
-            if new_session is not False and hasattr(self, 'on_session_started'):
-                # then it is a new session, and the concrete class has an on_session_started
-                # callback
-                getattr(self, 'on_session_started')(event['request'], event['session'])
+            # if its a new session, run the new session code
+            self._call_route(self._route_session_started(event, view))
 
             # regardless of whether its new, handle the request type
-            if request_type == "IntentRequest":
-                # Only handle IntentRequest here... all others in the else block
-                intent_name = self._get_intent_name(event['request'])
-                if intent_name is not None and intent_name.startswith("AMAZON."):
-                    response = self._handle_amazon_intent(event, context)
-                else:
-                    # this is a user specific intent, so let the users concrete
-                    # implementation handle it.
-                    response = self._handle_custom_intent(event, context)
-            else:
-                # LaunchRequest, SessionEndedRequest, AudioPlayer requests, etc
-                # are handled here.
-                self.logger.debug("Calling _handle_amazon_request")
-                response = self._handle_amazon_request(event, context)
+            response = self._call_route(self._route_event(event, context, view))
 
         except Exception as exc:
-            self.logger.error("Error in process_request: {0}".format(traceback.format_exc()))
-            self.logger.error(exc.message)
+            outcome = 'error'
+            self.logger.error("Error in process_request: %s", traceback.format_exc())
+            self.logger.error("%s", exc)
             response = self.on_processing_error(event, context, exc)
 
+        self._finish_event(event, started, outcome, previous_view)
         return response
 
+    def _start_event(self, event):
+        """
+        Start processing an event
+        :return: (started, previous_view), the start of the request log and the
+                 view to restore in _finish_event
+        """
+        started = self.request_log.start()
+        self.logger.debug("process_request: event: %s", event)
+        return started, _current_event_view.get()
+
+    def _enter_event(self, event):
+        """
+        Make the Event view of event the current view, called inside the error
+        handling so a malformed event reaches on_processing_error
+        :return: the Event view
+        """
+        view = Event(event)
+        _current_event_view.set(view)
+        self.logger.debug("event[request][type]: %s", view.request.type)
+        return view
+
+    def _check_event(self, event, check_app_id):
+        if check_app_id and not self.check_app_id(event):
+            raise NotImplementedError("Invalid Application ID")
+
+    def _finish_event(self, event, started, outcome, previous_view):
+        """
+        End processing an event, after the on_ handler returned
+        """
+        self._flush_pending_writes()
+        self.request_log.finish(started, event, outcome)
+        _current_event_view.set(previous_view)
+
+    @property
+    def _event_view(self):
+        # view over the event being processed by this thread or task, see AlexaEvent
+        return _current_event_view.get()
+
     # --------------- Helpers that build all of the responses ----------------------
     def _build_speechlet_response(self, card_title, card_output, speech_output, reprompt_text, should_end_session):
         """
@@ -288,45 +689,173 @@ class AlexaBaseHandler(object):
         """
         return {
             'version': '1.0',
-            'sessionAttributes': session_attributes,
+            'sessionAttributes': self._encode_session_attributes(session_attributes),
             'response': speechlet_response
         }
 
+    def _get_session_attributes(self, session):
+        """
+        Return a copy of the session attributes of the request, unpacked by the
+        session_codec if the handler has one
+        :param session: session from the event
+        :return: dict of the session attributes
+        """
+        if self.session_codec is not None:
+            return dict(self._decoded_session_attributes(session))
+        attributes = session.get('attributes') if session else None
+        return dict(attributes) if attributes else {}
+
+    def _decoded_session_attributes(self, session):
+        # the attributes are unpacked the first time they are used and then
+        # kept on the view of the session for the rest of the request
+        attributes = session.get('attributes') if session else None
+        view = self._event_view
+        view_session = view.session if view is not None else None
+        if view_session is None or view_session.raw is not session:
+            return self.session_codec.decode(attributes)
+        if view_session.decoded_attributes is None:
+            view_session.decoded_attributes = self.session_codec.decode(attributes)
+        return view_session.decoded_attributes
+
+    def _get_session_overlay(self, session):
+        """
+        Copy-on-write overlay over the session attributes of the request, see
+        AlexaSessionOverlay.  Pass overlay.attributes to _build_response, it is
+        the original object when nothing was changed.
+        :param session: session from the event
+        :return: SessionOverlay
+        """
+        if self.session_codec is not None:
+            return SessionOverlay(self._decoded_session_attributes(session))
+        return SessionOverlay(session.get('attributes') if session else None)
+
+    def _encode_session_attributes(self, session_attributes):
+        if self.session_codec is not None and session_attributes:
+            return self.session_codec.encode(session_attributes)
+        return session_attributes
+
+    def _build_speechlet_response_json(self, card_title, card_output, speech_output, reprompt_text, should_end_session):
+        """
+        Same as _build_speechlet_response but returns the JSON bytes of the
+        speechlet, to pass to _build_response_json
+        :return: JSON bytes
+        """
+        return AlexaResponse.speechlet_response(card_title, card_output, speech_output, reprompt_text, should_end_session)
+
+    def _build_response_json(self, session_attributes, speechlet_response):
+        """
+        Same as _build_response but returns the JSON bytes of the response.
+        Use this when the host writes the response itself, e.g. AlexaServer,
+        lambda functions have to return the dict from _build_response.
+        :param session_attributes:
+        :param speechlet_response: dict or bytes from _build_speechlet_response_json
+        :return: JSON bytes of the Alexa response message
+        """
+        return AlexaResponse.response(self._encode_session_attributes(session_attributes), speechlet_response)
+
+    def _user_id(self, source):
+        """
+        :param source: the event, or the session passed to the on_ intent handlers
+        :return: the Alexa user id
+        """
+        if 'request' in source:
+            return self._view_of(source).user_id
+        return Session(source).user_id
+
+    def _get_user_attributes(self, source):
+        """
+        Persistent attributes of the user from the attribute_store
+        :param source: the event, or the session passed to the on_ intent handlers
+        :return: attributes dict, empty for a new user
+        """
+        return self.attribute_store.get(self._user_id(source))
+
+    def _set_user_attributes(self, source, attributes):
+        """
+        Change the persistent attributes of the user.  They are written to the
+        attribute_store before process_request returns.
+        :param source: the event, or the session passed to the on_ intent handlers
+        :param attributes: attributes dict
+        :return: None
+        """
+        self.attribute_store.put(self._user_id(source), attributes)
+
+    def _flush_pending_writes(self):
+        """
+        Called at the end of every request, by process_request and
+        process_request_async, to write what the request changed.  Subclasses
+        that buffer writes, e.g. AlexaAudioBaseHandler, extend it.
+        """
+        self._flush_store(self.attribute_store)
+
+    def _flush_store(self, store):
+        """
+        Flush a CachedAttributeStore, e.g. the attribute_store, without failing the request
+        """
+        if store is not None and store.has_pending:
+            try:
+                store.flush()
+            except Exception:
+                # the pending changes are kept and written by the next flush
+                self.logger.error("Error flushing %s: %s", type(store).__name__, traceback.format_exc())
+
+    def _view_of(self, event):
+        """
+        :return: the Event view of the event being processed, or a new view
+                 if event is not the event being processed
+        """
+        view = self._event_view
+        if view is None or view.raw is not event:
+            view = Event(event)
+        return view
+
+    def _request_view(self, intent_request):
+        """
+        :return: the Request view of intent_request, parsed once per request
+        """
+        view = self._event_view
+        if view is not None:
+            request = view.request
+            if request.raw is intent_request:
+                return request
+        return Request(intent_request)
+
     def _is_intent(self, intent_name, intent_request):
         return self._get_intent_name(intent_request) == intent_name
 
     def _get_intent(self, intent_request):
-        if 'intent' in intent_request:
-            return intent_request['intent']
-        else:
-            return None
+        intent = self._request_view(intent_request).intent
+        return intent.raw if intent is not None else None
 
     def _get_intent_name(self, intent_request):
-        intent = self._get_intent(intent_request)
-        intent_name = None
-        if intent is not None and 'name' in intent:
-            intent_name = intent['name']
-
-        return intent_name
+        return self._request_view(intent_request).intent_name
 
     def _slot_exists(self, slot_name, intent_request):
-        intent = self._get_intent(intent_request)
-        if intent is not None and 'slots' in intent:
-            # alexa will send slots with a name but no 'value' element
-            # so check that both are there.
-            return slot_name in intent['slots'] and 'value' in intent['slots'][slot_name]
-        else:
-            return False
+        intent = self._request_view(intent_request).intent
+        # alexa will send slots with a name but no 'value' element
+        # so check that both are there.
+        return intent is not None and intent.slot_exists(slot_name)
 
     def _get_slot_value(self, slot_name, intent_request):
         value = None
         try:
-            if self._slot_exists(slot_name, intent_request):
-                intent = self._get_intent(intent_request)
-                value = intent['slots'][slot_name]['value']
-            else:
-                value = None
+            intent = self._request_view(intent_request).intent
+            if intent is not None:
+                value = intent.slot_value(slot_name)
         except Exception as exc:
             self.logger.error("Error getting slot value for slot_name={0}".format(slot_name))
 
         return value
+
+    def _resolve_slot(self, slot_name, intent_request, resolver):
+        """
+        Resolve the value of a slot onto a catalog, see AlexaSlotResolver
+        :param slot_name:
+        :param intent_request:
+        :param resolver: SlotResolver
+        :return: SlotMatch or None
+        """
+        intent = self._request_view(intent_request).intent
+        if intent is None:
+            return None
+        return resolver.resolve_slot(intent.get_slot(slot_name))
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Small thread safe LRU cache with an optional expiry per entry.
+
+    Entries expire ttl seconds after they are put, or at the expires_at time
+    given to put, whichever comes first.  When the cache holds maxsize entries
+    the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize=128, ttl=None, clock=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires_at = self._entries[key]
+            except KeyError:
+                return default
+
+            if expires_at is not None and expires_at <= self.clock():
+                del self._entries[key]
+                return default
+
+            # move to the most recently used end
+            del self._entries[key]
+            self._entries[key] = (value, expires_at)
+            return value
+
+    def put(self, key, value, expires_at=None):
+        if self.ttl is not None:
+            ttl_expires_at = self.clock() + self.ttl
+            if expires_at is None or ttl_expires_at < expires_at:
+                expires_at = ttl_expires_at
+
+        with self._lock:
+            if key in self._entries:
+                del self._entries[key]
+            elif len(self._entries) >= self.maxsize:
+                self._entries.popitem(last=False)
+            self._entries[key] = (value, expires_at)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __len__(self):
+        return len(self._entries)
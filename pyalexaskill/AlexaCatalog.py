@@ -0,0 +1,165 @@
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+from pyalexaskill.AlexaCache import LRUCache
+from pyalexaskill.AlexaPlaylist import Playlist, TOKEN_SEPARATOR
+from pyalexaskill.AlexaSlotResolver import normalize
+
+"""
+Read-only track catalog in an SQLite file, for catalogs too large to load
+into memory on every cold start.
+
+The catalog is built once, e.g. when the deployment package is created, and
+opened read-only by the handler.  Nothing is read until a track is used: the
+database is opened on first use, its pages are memory-mapped, and every
+lookup by position, token or name is one indexed query.  Recently used tracks
+are kept in a small LRU cache.
+
+SQLiteCatalog.build('catalog.db', tracks)      # tracks: iterable of track dicts
+self.playlist = SQLiteCatalog('catalog.db')    # in the handler
+
+SQLiteCatalog has the interface of AlexaPlaylist.Playlist, so it can be the
+playlist of an AlexaAudioBaseHandler and of a PlaybackQueue.
+"""
+
+_TRACK_FIELDS = ('token', 'name', 'url')
+
+
+class SQLiteCatalog(Playlist):
+    """
+    :param path: catalog file created by build
+    :param cache_size: number of tracks kept in memory
+    :param mmap_size: bytes of the database file that are memory-mapped
+    """
+
+    def __init__(self, path, cache_size=1024, mmap_size=256 * 1024 * 1024):
+        self.path = path
+        self.mmap_size = mmap_size
+        self._connection = None
+        self._length = None
+        self._cache = LRUCache(cache_size)
+        self._lock = threading.Lock()
+        self._permutations = {}
+
+    @classmethod
+    def build(cls, path, tracks, batch_size=10000):
+        """
+        Write a catalog file from the tracks, replacing the tracks in the file
+        :param path: catalog file
+        :param tracks: iterable of track dicts with 'url' and optionally 'token' and 'name',
+                       other fields are kept as JSON
+        :return: number of tracks
+        """
+        connection = sqlite3.connect(path)
+        try:
+            with connection:
+                connection.execute("DROP TABLE IF EXISTS tracks")
+                connection.execute("CREATE TABLE tracks (position INTEGER PRIMARY KEY, token TEXT NOT NULL, "
+                                   "name TEXT, name_key TEXT, url TEXT, extra TEXT)")
+                count = 0
+                rows = []
+                for position, track in enumerate(tracks):
+                    extra = dict((key, value) for key, value in track.items() if key not in _TRACK_FIELDS)
+                    name = track.get('name')
+                    rows.append((position, track.get('token') or str(position), name,
+                                 normalize(name) if name else None, track.get('url'),
+                                 json.dumps(extra, separators=(',', ':')) if extra else None))
+                    if len(rows) >= batch_size:
+                        connection.executemany("INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?)", rows)
+                        rows = []
+                    count = position + 1
+                if rows:
+                    connection.executemany("INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?)", rows)
+                connection.execute("CREATE INDEX tracks_token ON tracks (token)")
+                connection.execute("CREATE INDEX tracks_name_key ON tracks (name_key)")
+            connection.execute("VACUUM")
+        finally:
+            connection.close()
+        return count
+
+    def _connect(self):
+        connection = self._connection
+        if connection is None:
+            with self._lock:
+                if self._connection is None:
+                    if sys.version_info[0] >= 3:
+                        # quoted, so a ? # or % in the path is not read as part of the uri
+                        uri = "file:{0}?mode=ro".format(quote(os.path.abspath(self.path).replace(os.path.sep, "/")))
+                        connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                    else:
+                        connection = sqlite3.connect(self.path, check_same_thread=False)
+                    connection.execute("PRAGMA mmap_size = {0:d}".format(self.mmap_size))
+                    self._connection = connection
+                connection = self._connection
+        return connection
+
+    def _query(self, sql, parameters=()):
+        connection = self._connect()
+        with self._lock:
+            return connection.execute(sql, parameters).fetchall()
+
+    @staticmethod
+    def _track(row):
+        position, token, name, url, extra = row
+        track = json.loads(extra) if extra else {}
+        track['token'] = token
+        track['name'] = name
+        track['url'] = url
+        return track
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    # --------------- Playlist interface ----------------------
+    def __len__(self):
+        if self._length is None:
+            last = self._query("SELECT MAX(position) FROM tracks")[0][0]
+            self._length = last + 1 if last is not None else 0
+        return self._length
+
+    def track(self, position):
+        track = self._cache.get(position)
+        if track is None:
+            rows = self._query("SELECT position, token, name, url, extra FROM tracks WHERE position = ?", (position,))
+            if not rows:
+                raise IndexError(position)
+            track = self._track(rows[0])
+            self._cache.put(position, track)
+        return track
+
+    def track_token(self, position):
+        return self.track(position)['token']
+
+    def position_of(self, token):
+        if token is None:
+            return None
+        rows = self._query("SELECT position FROM tracks WHERE token = ? LIMIT 1", (token,))
+        if not rows and TOKEN_SEPARATOR in token:
+            rows = self._query("SELECT position FROM tracks WHERE token = ? LIMIT 1",
+                               (token.rpartition(TOKEN_SEPARATOR)[0],))
+        return rows[0][0] if rows else None
+
+    def find(self, name, limit=10):
+        rows = self._query("SELECT position, token, name, url, extra FROM tracks WHERE name_key = ? "
+                           "ORDER BY position LIMIT ?", (normalize(name), limit))
+        return [(row[0], self._track(row)) for row in rows]
+
+    def sample(self, count):
+        length = len(self)
+        count = min(count, length)
+        positions = set()
+        while len(positions) < count:
+            positions.add(random.randrange(length))
+        return [(position, self.track(position)) for position in positions]
@@ -0,0 +1,216 @@
+"""
+Light, read-only views over the raw Alexa event dict.
+
+Each part of the event, the request, session, intent and slots, is parsed the
+first time it is accessed and then kept on the view, so the dispatch path and
+the handler helpers do not probe the same nested dicts over and over again.
+The views never copy or change the raw event, the raw dicts are available as
+the raw attribute of every view.
+
+event = Event(raw_event)
+event.request.type
+event.request.intent_name
+event.request.intent.slot_value('Station')
+event.session.attributes
+"""
+
+_NOT_PARSED = object()
+
+
+class Slot(object):
+    __slots__ = ('raw', 'name', 'value')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.name = raw.get('name')
+        # alexa will send slots with a name but no 'value' element
+        self.value = raw.get('value')
+
+    @property
+    def has_value(self):
+        return self.value is not None
+
+    @property
+    def resolutions(self):
+        """
+        :return: the resolutionsPerAuthority list of the slot, or an empty list
+        """
+        try:
+            return self.raw['resolutions']['resolutionsPerAuthority']
+        except (KeyError, TypeError):
+            return []
+
+
+class Intent(object):
+    __slots__ = ('raw', 'name', '_slots')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.name = raw.get('name')
+        self._slots = None
+
+    @property
+    def slots(self):
+        """
+        :return: dict of slot name -> Slot
+        """
+        slots = self._slots
+        if slots is None:
+            raw_slots = self.raw.get('slots') or {}
+            slots = self._slots = dict((name, Slot(raw_slot)) for name, raw_slot in raw_slots.items())
+        return slots
+
+    def get_slot(self, slot_name):
+        return self.slots.get(slot_name)
+
+    def slot_exists(self, slot_name):
+        slot = self.slots.get(slot_name)
+        return slot is not None and slot.value is not None
+
+    def slot_value(self, slot_name, default=None):
+        slot = self.slots.get(slot_name)
+        if slot is None or slot.value is None:
+            return default
+        return slot.value
+
+
+class Request(object):
+    __slots__ = ('raw', 'type', '_intent')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.type = raw.get('type')
+        self._intent = _NOT_PARSED
+
+    @property
+    def intent(self):
+        """
+        :return: Intent, or None if the request has no intent
+        """
+        intent = self._intent
+        if intent is _NOT_PARSED:
+            raw_intent = self.raw.get('intent')
+            intent = self._intent = Intent(raw_intent) if raw_intent is not None else None
+        return intent
+
+    @property
+    def intent_name(self):
+        intent = self.intent
+        return intent.name if intent is not None else None
+
+    @property
+    def token(self):
+        return self.raw.get('token')
+
+    @property
+    def offset(self):
+        return self.raw.get('offsetInMilliseconds')
+
+
+class Session(object):
+    __slots__ = ('raw', 'new', 'decoded_attributes')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.new = raw.get('new', False)
+        # attributes unpacked by the session_codec of the handler, see
+        # AlexaBaseHandler._get_session_attributes
+        self.decoded_attributes = None
+
+    @property
+    def attributes(self):
+        """
+        :return: the raw session attributes dict, not a copy, or None
+        """
+        return self.raw.get('attributes')
+
+    @property
+    def application_id(self):
+        try:
+            return self.raw['application']['applicationId']
+        except (KeyError, TypeError):
+            return None
+
+    @property
+    def user_id(self):
+        try:
+            return self.raw['user']['userId']
+        except (KeyError, TypeError):
+            return None
+
+    @property
+    def session_id(self):
+        return self.raw.get('sessionId')
+
+
+class Event(object):
+    __slots__ = ('raw', '_request', '_session')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._request = None
+        self._session = _NOT_PARSED
+
+    @property
+    def request(self):
+        request = self._request
+        if request is None:
+            request = self._request = Request(self.raw.get('request') or {})
+        return request
+
+    @property
+    def session(self):
+        """
+        :return: Session, or None for events without a session, e.g. AudioPlayer requests
+        """
+        session = self._session
+        if session is _NOT_PARSED:
+            raw_session = self.raw.get('session')
+            session = self._session = Session(raw_session) if raw_session is not None else None
+        return session
+
+    @property
+    def user_id(self):
+        """
+        :return: the user id from the session, or from the context for events without a session
+        """
+        session = self.session
+        if session is not None and session.user_id is not None:
+            return session.user_id
+        try:
+            return self.raw['context']['System']['user']['userId']
+        except (KeyError, TypeError):
+            return None
+
+    @property
+    def application_id(self):
+        """
+        :return: the application id from the session, or from the context for events without a session
+        """
+        session = self.session
+        if session is not None and session.application_id is not None:
+            return session.application_id
+        try:
+            return self.raw['context']['System']['application']['applicationId']
+        except (KeyError, TypeError):
+            return None
+
+    @property
+    def audio_player_token(self):
+        """
+        :return: token of the stream the AudioPlayer of the device is on, from the context, or None
+        """
+        try:
+            return self.raw['context']['AudioPlayer'].get('token')
+        except (KeyError, TypeError, AttributeError):
+            return None
+
+    @property
+    def audio_player_offset(self):
+        """
+        :return: offsetInMilliseconds of the AudioPlayer of the device, from the context, or None
+        """
+        try:
+            return self.raw['context']['AudioPlayer'].get('offsetInMilliseconds')
+        except (KeyError, TypeError, AttributeError):
+            return None
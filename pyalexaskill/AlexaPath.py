@@ -0,0 +1,75 @@
+"""
+Dotted path access for nested session attributes, e.g. 'app_context.stations.origin'.
+
+Each path is split into its segments once and the compiled path is cached, so
+repeated lookups of the same path only walk the nested dicts.  Path segments
+that are digits index into lists that already exist.  Writes go through
+AlexaSessionOverlay, which walks the same segments.
+"""
+
+_MISSING = object()
+
+_GLOB_CHARS = frozenset("*?[")
+
+# path -> CompiledPath
+_compiled_paths = {}
+_MAX_COMPILED_PATHS = 1024
+
+
+class CompiledPath(object):
+    __slots__ = ('path', 'segments')
+
+    def __init__(self, path, separator='.'):
+        self.path = path
+        self.segments = tuple(segment for segment in path.split(separator) if segment)
+        if not self.segments:
+            raise ValueError("Empty attribute path: {0!r}".format(path))
+
+    @property
+    def is_glob(self):
+        return any(_GLOB_CHARS.intersection(segment) for segment in self.segments)
+
+    def get(self, data, default=_MISSING):
+        """
+        :param data: nested dicts
+        :param default: returned if the path does not exist
+        :return: value at the path
+        :raise KeyError: if the path does not exist and no default is given
+        """
+        value = self._lookup(data)
+        if value is _MISSING:
+            if default is _MISSING:
+                raise KeyError(self.path)
+            return default
+        return value
+
+    def _lookup(self, data):
+        node = data
+        for segment in self.segments:
+            node = _child(node, segment)
+            if node is _MISSING:
+                break
+        return node
+
+
+def _child(node, segment):
+    if isinstance(node, dict):
+        return node.get(segment, _MISSING)
+    if isinstance(node, list) and segment.isdigit():
+        index = int(segment)
+        return node[index] if index < len(node) else _MISSING
+    return _MISSING
+
+
+def compile_path(path, separator='.'):
+    """
+    :param path: dotted path
+    :return: cached CompiledPath for the path
+    """
+    key = (path, separator)
+    compiled = _compiled_paths.get(key)
+    if compiled is None:
+        if len(_compiled_paths) >= _MAX_COMPILED_PATHS:
+            _compiled_paths.clear()
+        compiled = _compiled_paths[key] = CompiledPath(path, separator)
+    return compiled
@@ -0,0 +1,147 @@
+import json
+import logging
+import threading
+import time
+
+"""
+Listening metrics for audio skills, aggregated in memory.
+
+Each playback event adds one to a counter of its track and is kept in a fixed
+size ring buffer of recent events.  The counters are flushed as one summary,
+by default one JSON line on the 'pyalexaskill.playback' logger, when
+flush_interval seconds have passed or max_events events were counted, so a
+write happens per flush instead of per event.
+
+stats = PlaybackStats(flush_interval=60, max_events=1000)
+stats.record('track-1', STARTED)
+stats.flush(force=True)
+
+The summary is a dict like:
+{"events": 3, "seconds": 60.0,
+ "tracks": {"track-1": {"started": 2, "finished": 1, "stopped": 0, "failed": 0, "skipped": 0, "skip_rate": 0.0}}}
+"""
+
+STARTED = 0
+FINISHED = 1
+STOPPED = 2
+FAILED = 3
+SKIPPED = 4
+
+EVENT_NAMES = ("started", "finished", "stopped", "failed", "skipped")
+
+# request type -> event kind
+REQUEST_EVENTS = {
+    "AudioPlayer.PlaybackStarted": STARTED,
+    "AudioPlayer.PlaybackFinished": FINISHED,
+    "AudioPlayer.PlaybackStopped": STOPPED,
+    "AudioPlayer.PlaybackFailed": FAILED,
+    "PlaybackController.NextCommandIssued": SKIPPED,
+}
+
+logger = logging.getLogger("pyalexaskill.playback")
+
+
+def log_summary(summary):
+    """
+    Default sink, logs the summary as one JSON line
+    """
+    logger.info("%s", json.dumps(summary, separators=(',', ':'), sort_keys=True))
+
+
+class PlaybackStats(object):
+    """
+    :param flush_interval: seconds after which the next event flushes the counters
+    :param max_events: number of counted events that flushes the counters
+    :param ring_size: number of recent events kept
+    :param sink: callable(summary) that writes a summary, log_summary by default
+    """
+
+    def __init__(self, flush_interval=60.0, max_events=1000, ring_size=256, sink=log_summary, clock=time.time):
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self.sink = sink
+        self._clock = clock
+        self._ring = [None] * ring_size
+        self._ring_next = 0
+        # token -> list of counts, indexed by event kind
+        self._counters = {}
+        self._events = 0
+        self._last_flush = clock()
+        self._lock = threading.Lock()
+
+    def record(self, token, kind):
+        """
+        Count a playback event, and flush if it is due
+        :param token: track token
+        :param kind: STARTED, FINISHED, STOPPED, FAILED or SKIPPED
+        """
+        if token is None:
+            return
+        now = self._clock()
+        with self._lock:
+            counts = self._counters.get(token)
+            if counts is None:
+                counts = self._counters[token] = [0] * len(EVENT_NAMES)
+            counts[kind] += 1
+            self._events += 1
+            if self._ring:
+                self._ring[self._ring_next] = (now, token, kind)
+                self._ring_next = (self._ring_next + 1) % len(self._ring)
+            due = self._events >= self.max_events or now - self._last_flush >= self.flush_interval
+        if due:
+            self.flush(force=True)
+
+    def record_request(self, request_type, token):
+        """
+        Count an AudioPlayer or PlaybackController request, other request types are ignored
+        """
+        kind = REQUEST_EVENTS.get(request_type)
+        if kind is not None:
+            self.record(token, kind)
+
+    def recent(self):
+        """
+        :return: list of the recent events as (time, token, event name), oldest first
+        """
+        with self._lock:
+            entries = self._ring[self._ring_next:] + self._ring[:self._ring_next]
+        return [(at, token, EVENT_NAMES[kind]) for at, token, kind in (entry for entry in entries if entry is not None)]
+
+    def summary(self):
+        """
+        :return: summary of the counters since the last flush, without resetting them
+        """
+        with self._lock:
+            return self._summary(self._counters, self._events, self._clock() - self._last_flush)
+
+    @staticmethod
+    def _summary(counters, events, seconds):
+        tracks = {}
+        for token, counts in counters.items():
+            track = dict(zip(EVENT_NAMES, counts))
+            started = counts[STARTED]
+            track['skip_rate'] = round(float(counts[SKIPPED]) / started, 4) if started else None
+            tracks[token] = track
+        return {'events': events, 'seconds': round(seconds, 3), 'tracks': tracks}
+
+    def flush(self, force=False):
+        """
+        Write the summary of the counters to the sink and reset them
+        :param force: flush even if flush_interval and max_events are not reached
+        :return: the summary written, or None
+        """
+        now = self._clock()
+        with self._lock:
+            if not self._events:
+                return None
+            if not force and self._events < self.max_events and now - self._last_flush < self.flush_interval:
+                return None
+            summary = self._summary(self._counters, self._events, now - self._last_flush)
+            self._counters = {}
+            self._events = 0
+            self._last_flush = now
+        try:
+            self.sink(summary)
+        except Exception:
+            logger.exception("Error writing playback summary")
+        return summary
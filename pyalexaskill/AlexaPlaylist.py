@@ -0,0 +1,302 @@
+import random
+
+from pyalexaskill.AlexaSlotResolver import normalize
+
+"""
+Playlist and playback queue for AlexaAudioBaseHandler.
+
+A Playlist is the list of tracks, each a dict with at least a 'url' and usually
+a 'name' and a 'token', with an index from token to track.  For large catalogs
+AlexaCatalog.SQLiteCatalog has the same interface and reads the tracks from an
+on-disk index as they are used.
+
+A PlaybackQueue is the position of a user in a playlist.  Its whole state is
+four integers, the cursor in the play order, the shuffle seed (0 when not
+shuffled), the loop mode and the start of the shuffled order, so it can be
+kept in the session attributes and in the stream token of the AudioPlayer
+directives no matter how long the playlist is.  The shuffled play order is a
+seeded permutation computed per position, rotated so that it starts at the
+track that was playing when shuffle was turned on.  Next, previous and
+finding the position of a track are O(1).
+"""
+
+LOOP_OFF = 0
+LOOP_ALL = 1
+LOOP_ONE = 2
+
+# separates the track token from the queue state in a stream token
+TOKEN_SEPARATOR = "~"
+
+
+def _mix(value, key):
+    # integer hash used as the round function of the permutation
+    value = ((value ^ key) * 0x45d9f3b) & 0xffffffff
+    value = ((value >> 16) ^ value) * 0x45d9f3b & 0xffffffff
+    return (value >> 16) ^ value
+
+
+class SeededPermutation(object):
+    """
+    Pseudo random permutation of range(size) for a seed, computed per position
+    with a small Feistel network and cycle walking, so the permutation is
+    never stored.
+    """
+    __slots__ = ('size', '_half_bits', '_mask', '_keys')
+
+    def __init__(self, size, seed, rounds=4):
+        self.size = size
+        bits = max(2, (size - 1).bit_length())
+        bits += bits % 2
+        self._half_bits = bits // 2
+        self._mask = (1 << self._half_bits) - 1
+        generator = random.Random(seed)
+        self._keys = tuple(generator.getrandbits(32) for _ in range(rounds))
+
+    def _encrypt(self, value):
+        left, right = value >> self._half_bits, value & self._mask
+        for key in self._keys:
+            left, right = right, left ^ (_mix(right, key) & self._mask)
+        return (left << self._half_bits) | right
+
+    def _decrypt(self, value):
+        left, right = value >> self._half_bits, value & self._mask
+        for key in reversed(self._keys):
+            left, right = right ^ (_mix(left, key) & self._mask), left
+        return (left << self._half_bits) | right
+
+    def forward(self, index):
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def inverse(self, position):
+        value = self._decrypt(position)
+        while value >= self.size:
+            value = self._decrypt(value)
+        return value
+
+
+class Playlist(object):
+    """
+    :param tracks: list of track dicts, with 'url' and optionally 'name' and 'token'.
+                   Tracks without a token use their position as token.
+    """
+
+    def __init__(self, tracks):
+        self.tracks = list(tracks)
+        self._positions = {}
+        for position, track in enumerate(self.tracks):
+            self._positions.setdefault(self.track_token(position), position)
+        # normalized name -> positions, built on the first find
+        self._names = None
+        # seed -> SeededPermutation, shared by all queues on this playlist
+        self._permutations = {}
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def track(self, position):
+        """
+        :return: track dict at the position
+        """
+        return self.tracks[position]
+
+    def find(self, name, limit=10):
+        """
+        :param name: track name, compared case and punctuation insensitive
+        :return: list of (position, track) with that name, at most limit
+        """
+        if self._names is None:
+            names = {}
+            for position, track in enumerate(self.tracks):
+                names.setdefault(normalize(track.get('name') or ''), []).append(position)
+            self._names = names
+        return [(position, self.tracks[position]) for position in self._names.get(normalize(name), [])[:limit]]
+
+    def sample(self, count):
+        """
+        :return: list of (position, track) for count random tracks
+        """
+        positions = random.sample(range(len(self)), min(count, len(self)))
+        return [(position, self.track(position)) for position in positions]
+
+    def track_token(self, position):
+        token = self.tracks[position].get('token')
+        return token if token else str(position)
+
+    def position_of(self, token):
+        """
+        :param token: track token, or a stream token created by a PlaybackQueue
+        :return: position of the track in the playlist, or None
+        """
+        if token is None:
+            return None
+        position = self._positions.get(token)
+        if position is None and TOKEN_SEPARATOR in token:
+            position = self._positions.get(token.rpartition(TOKEN_SEPARATOR)[0])
+        return position
+
+    def permutation(self, seed):
+        permutation = self._permutations.get(seed)
+        if permutation is None:
+            if len(self._permutations) > 64:
+                self._permutations.clear()
+            permutation = self._permutations[seed] = SeededPermutation(len(self), seed)
+        return permutation
+
+
+class PlaybackQueue(object):
+    """
+    Position of a user in a Playlist.
+
+    :param playlist: Playlist
+    :param cursor: position in the play order
+    :param seed: shuffle seed, 0 when the queue is not shuffled
+    :param loop: LOOP_OFF, LOOP_ALL or LOOP_ONE
+    :param start: index in the permutation of the seed that the shuffled order starts at
+    """
+    __slots__ = ('playlist', 'cursor', 'seed', 'loop', 'start')
+
+    def __init__(self, playlist, cursor=0, seed=0, loop=LOOP_OFF, start=0):
+        self.playlist = playlist
+        size = len(playlist)
+        self.cursor = cursor % size if size else 0
+        self.seed = seed
+        self.loop = loop
+        self.start = start % size if size else 0
+
+    # --------------- state ----------------------
+    def state(self):
+        """
+        :return: compact string with the state of the queue, e.g. '12.0.1.0'
+        """
+        return "{0}.{1}.{2}.{3}".format(self.cursor, self.seed, self.loop, self.start)
+
+    @classmethod
+    def from_state(cls, playlist, state):
+        """
+        :param playlist: Playlist
+        :param state: string from state(), or a stream token from stream_token()
+        :return: PlaybackQueue, or None if state is not a valid queue state
+        """
+        if not state:
+            return None
+        if TOKEN_SEPARATOR in state:
+            state = state.rpartition(TOKEN_SEPARATOR)[2]
+        try:
+            parts = [int(part) for part in state.split(".")]
+        except ValueError:
+            return None
+        if len(parts) not in (3, 4):
+            return None
+        return cls(playlist, *parts)
+
+    def stream_token(self):
+        """
+        :return: token for the AudioPlayer directive of the current track, the
+                 track token followed by the state of the queue, so AudioPlayer
+                 events, which have no session, can restore the queue
+        """
+        return "{0}{1}{2}".format(self.playlist.track_token(self.position), TOKEN_SEPARATOR, self.state())
+
+    # --------------- navigation ----------------------
+    @property
+    def shuffled(self):
+        return self.seed != 0
+
+    @property
+    def position(self):
+        """
+        :return: position in the playlist of the current track
+        """
+        if self.seed and len(self.playlist):
+            return self.playlist.permutation(self.seed).forward((self.cursor + self.start) % len(self.playlist))
+        return self.cursor
+
+    def current(self):
+        """
+        :return: current track dict, None if the playlist is empty
+        """
+        if not len(self.playlist):
+            return None
+        return self.playlist.track(self.position)
+
+    def next(self, automatic=False):
+        """
+        Move to the next track in the play order
+        :param automatic: True when the current track finished by itself, e.g.
+                          on PlaybackNearlyFinished, so LOOP_ONE repeats it
+        :return: the next track, or None at the end of the queue when not looping
+        """
+        if not len(self.playlist):
+            return None
+        if automatic and self.loop == LOOP_ONE:
+            return self.current()
+        if self.cursor + 1 >= len(self.playlist):
+            if self.loop == LOOP_OFF:
+                return None
+            self.cursor = 0
+        else:
+            self.cursor += 1
+        return self.current()
+
+    def peek_next(self, automatic=False):
+        """
+        :return: the track next() would move to, without moving
+        """
+        cursor = self.cursor
+        track = self.next(automatic)
+        self.cursor = cursor
+        return track
+
+    def previous(self):
+        """
+        :return: the previous track in the play order, or None at the start when not looping
+        """
+        if not len(self.playlist):
+            return None
+        if self.cursor == 0:
+            if self.loop == LOOP_OFF:
+                return None
+            self.cursor = len(self.playlist) - 1
+        else:
+            self.cursor -= 1
+        return self.current()
+
+    def jump_to(self, token):
+        """
+        Make the track with the token the current track, keeping shuffle and loop
+        :param token: track or stream token
+        :return: the track, or None if the playlist has no such track
+        """
+        position = self.playlist.position_of(token)
+        if position is None:
+            return None
+        if self.seed:
+            size = len(self.playlist)
+            self.cursor = (self.playlist.permutation(self.seed).inverse(position) - self.start) % size
+        else:
+            self.cursor = position
+        return self.current()
+
+    def shuffle(self, on=True, seed=None):
+        """
+        Turn shuffle on or off, the current track stays the current track.
+        The shuffled order starts at the current track, so every track of the
+        playlist is played once before the queue ends or loops.
+        :param on:
+        :param seed: seed for the new play order, random if not supplied
+        """
+        position = self.position
+        if on:
+            self.seed = seed or random.randint(1, 0x7fffffff)
+            self.cursor = 0
+            self.start = self.playlist.permutation(self.seed).inverse(position) if len(self.playlist) else 0
+        else:
+            self.seed = 0
+            self.cursor = position
+            self.start = 0
+
+    def set_loop(self, loop):
+        self.loop = loop
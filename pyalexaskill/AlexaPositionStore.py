@@ -0,0 +1,85 @@
+import time
+
+from pyalexaskill.AlexaAttributeStore import CachedAttributeStore
+
+"""
+Playback positions per Alexa user, the token of the stream and the offset in
+milliseconds it was stopped at, so a Resume intent can continue where the user
+left off, on any device.
+
+PositionStore is a CachedAttributeStore that keeps a {'token', 'offset'} dict
+per user.  Changed positions are written to an optional AttributeStore backend
+by flush, which AlexaAudioBaseHandler calls before process_request returns, so
+the positions recorded in a request are one write at its end.  A lambda process can be frozen or ended after any
+request, so by default every flush writes.  On a long running host, e.g.
+AlexaServer, flush_interval batches the writes of several requests: flush then
+writes only when flush_interval seconds have passed since the last write, or
+max_pending users have changed positions.
+
+store = PositionStore(SQLiteAttributeStore('/tmp/positions.db', table='playback_positions'))
+store.record(user_id, token, offset)
+position = store.get(user_id)
+"""
+
+
+class PlaybackPosition(object):
+    __slots__ = ('token', 'offset')
+
+    def __init__(self, token, offset):
+        self.token = token
+        self.offset = offset
+
+    def __repr__(self):
+        return "PlaybackPosition(token={0!r}, offset={1!r})".format(self.token, self.offset)
+
+
+class PositionStore(CachedAttributeStore):
+    """
+    :param backend: optional AlexaAttributeStore.AttributeStore the positions are
+                    written to, None to keep them in the process only
+    :param flush_interval: minimum seconds between two writes to the backend,
+                           0, the default, to write at every flush
+    :param max_pending: number of changed positions that are written regardless
+                        of flush_interval
+    :param cache_size: number of users kept in the cache
+    :param cache_ttl: seconds a position is kept in the cache, set it when other
+                      processes write to the same backend
+    """
+
+    def __init__(self, backend=None, flush_interval=0.0, max_pending=256, cache_size=4096, cache_ttl=None,
+                 clock=time.time):
+        CachedAttributeStore.__init__(self, backend, cache_size=cache_size, cache_ttl=cache_ttl,
+                                      flush_interval=flush_interval, max_pending=max_pending, clock=clock)
+
+    def get(self, user_id):
+        """
+        :param user_id:
+        :return: PlaybackPosition of the user, or None
+        """
+        if user_id is None:
+            return None
+        if self.backend is None:
+            stored = self._cache.get(user_id)
+        else:
+            stored = CachedAttributeStore.get(self, user_id)
+        if not stored:
+            return None
+        return PlaybackPosition(stored.get('token'), stored.get('offset', 0))
+
+    def record(self, user_id, token, offset):
+        """
+        Remember the position of a user.  It is written to the backend by a later flush.
+        """
+        if user_id is None or token is None:
+            return
+        position = {'token': token, 'offset': offset or 0}
+        if self.backend is None:
+            self._cache.put(user_id, position)
+        else:
+            self.put(user_id, position)
+
+    def forget(self, user_id):
+        if self.backend is None:
+            self._cache.pop(user_id)
+        else:
+            self.delete(user_id)
@@ -0,0 +1,62 @@
+import json
+import logging
+import random
+import time
+
+
+class AlexaRequestLog(object):
+    """
+    Writes one structured JSON line per processed request, for example:
+
+    {"intent":"AMAZON.YesIntent","latency_ms":1.2,"outcome":"ok","request_type":"IntentRequest"}
+
+    Only a sample of the requests are logged, controlled by sample_rate, where
+    0.0 logs nothing and 1.0 logs every request.  When a request is not sampled
+    no timing or formatting is done for it at all.
+    """
+
+    def __init__(self, sample_rate=0.0, logger_name="pyalexaskill.requests", level=logging.INFO):
+        self.sample_rate = sample_rate
+        self.level = level
+        self.logger = logging.getLogger(logger_name)
+
+    def start(self):
+        """
+        Decide if the current request should be logged.
+        :return: start time of the request if it is sampled, otherwise None
+        """
+        if self.sample_rate <= 0.0 or not self.logger.isEnabledFor(self.level):
+            return None
+
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+
+        return time.time()
+
+    def finish(self, started, event, outcome):
+        """
+        Write the JSON line for a request started with start()
+        :param started: value returned by start(), nothing is written if it is None
+        :param event: Alexa event
+        :param outcome: 'ok' or 'error'
+        :return: None
+        """
+        if started is None:
+            return
+
+        request_type = None
+        intent_name = None
+        try:
+            request = event['request']
+            request_type = request.get('type')
+            intent_name = request['intent']['name']
+        except (KeyError, TypeError, AttributeError):
+            pass
+
+        record = {
+            'request_type': request_type,
+            'intent': intent_name,
+            'latency_ms': round((time.time() - started) * 1000.0, 3),
+            'outcome': outcome
+        }
+        self.logger.log(self.level, json.dumps(record, separators=(',', ':'), sort_keys=True))
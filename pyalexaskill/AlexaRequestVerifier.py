@@ -0,0 +1,325 @@
+import base64
+import calendar
+import json
+import logging
+import os
+import posixpath
+import re
+import ssl
+import time
+from datetime import datetime
+
+try:
+    from urllib.parse import urlparse
+    from urllib.request import urlopen
+except ImportError:
+    from urlparse import urlparse
+    from urllib2 import urlopen
+
+try:
+    from cryptography import x509
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+except ImportError:
+    x509 = None
+
+from pyalexaskill.AlexaCache import LRUCache
+
+"""
+Verification of the requests that Alexa sends to a self hosted skill endpoint,
+see:
+
+https://developer.amazon.com/docs/custom-skills/host-a-custom-skill-as-a-web-service.html
+
+The signing certificate chain is fetched, parsed and validated once per
+certificate url and the public key of the signing certificate is kept in an
+LRU cache until the certificate or the cache entry expires.
+
+Requires the cryptography package.
+"""
+
+logger = logging.getLogger("pyalexaskill.verifier")
+
+SIGNING_CERT_SAN = "echo-api.amazon.com"
+MAX_TIMESTAMP_SKEW = 150
+
+_PEM_CERT_RE = re.compile(b"-----BEGIN CERTIFICATE-----.+?-----END CERTIFICATE-----", re.DOTALL)
+
+
+class VerificationError(ValueError):
+    pass
+
+
+class HTTPCertificateFetcher(object):
+    """
+    Fetches the certificate chain from the SignatureCertChainUrl
+    """
+
+    def __init__(self, timeout=5):
+        self.timeout = timeout
+
+    def __call__(self, url):
+        response = urlopen(url, timeout=self.timeout)
+        try:
+            return response.read()
+        finally:
+            response.close()
+
+
+class FileCertificateFetcher(object):
+    """
+    Reads certificate chains from a local directory, using the file name of
+    the SignatureCertChainUrl, e.g. echo-api-cert-4.pem.  Useful for tests
+    and for hosts that are not allowed to fetch the chain themselves.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __call__(self, url):
+        filename = posixpath.basename(urlparse(url).path)
+        with open(os.path.join(self.directory, filename), 'rb') as f:
+            return f.read()
+
+
+def _load_pem_certificates(data):
+    return [x509.load_pem_x509_certificate(block) for block in _PEM_CERT_RE.findall(data)]
+
+
+def _cert_timestamp(cert, name):
+    # cryptography 42 added timezone aware *_utc properties
+    value = getattr(cert, name + "_utc", None)
+    if value is None:
+        value = getattr(cert, name)
+    return calendar.timegm(value.utctimetuple())
+
+
+def _verify_signed_by(cert, issuer):
+    """
+    :raise VerificationError: if cert was not signed by issuer
+    """
+    if cert.issuer != issuer.subject:
+        raise VerificationError("Certificate issuer does not match: {0}".format(cert.issuer.rfc4514_string()))
+
+    public_key = issuer.public_key()
+    try:
+        if isinstance(public_key, ec.EllipticCurvePublicKey):
+            public_key.verify(cert.signature, cert.tbs_certificate_bytes, ec.ECDSA(cert.signature_hash_algorithm))
+        elif isinstance(public_key, rsa.RSAPublicKey):
+            public_key.verify(cert.signature, cert.tbs_certificate_bytes, padding.PKCS1v15(), cert.signature_hash_algorithm)
+        else:
+            raise VerificationError("Unsupported issuer key type: {0}".format(issuer.subject.rfc4514_string()))
+    except InvalidSignature:
+        raise VerificationError("Invalid certificate signature: {0}".format(cert.subject.rfc4514_string()))
+
+
+def _basic_constraints(cert):
+    try:
+        return cert.extensions.get_extension_for_class(x509.BasicConstraints).value
+    except x509.ExtensionNotFound:
+        return None
+
+
+def _check_path_length(issuer, intermediates_below):
+    constraints = _basic_constraints(issuer)
+    if constraints is not None and constraints.path_length is not None and intermediates_below > constraints.path_length:
+        raise VerificationError("Issuer path length constraint exceeded: {0}".format(issuer.subject.rfc4514_string()))
+
+
+def _check_can_issue(issuer, intermediates_below):
+    """
+    Check a certificate of the chain is a CA that may sign certificates, with
+    intermediates_below non self issued CA certificates under it
+    :raise VerificationError: if issuer may not sign the certificate below it
+    """
+    name = issuer.subject.rfc4514_string()
+    constraints = _basic_constraints(issuer)
+    if constraints is None or not constraints.ca:
+        raise VerificationError("Issuer is not a CA certificate: {0}".format(name))
+    try:
+        key_usage = issuer.extensions.get_extension_for_class(x509.KeyUsage).value
+    except x509.ExtensionNotFound:
+        raise VerificationError("Issuer has no key usage: {0}".format(name))
+    if not key_usage.key_cert_sign:
+        raise VerificationError("Issuer may not sign certificates: {0}".format(name))
+    _check_path_length(issuer, intermediates_below)
+
+
+def validate_cert_url(url):
+    """
+    Check the SignatureCertChainUrl is an Amazon echo api url:
+    https, host s3.amazonaws.com, path starting with /echo.api/ and port 443
+    :raise VerificationError: if the url is not valid
+    """
+    parsed = urlparse(url)
+    if parsed.scheme.lower() != "https":
+        raise VerificationError("Certificate url must use https: {0}".format(url))
+    if (parsed.hostname or "").lower() != "s3.amazonaws.com":
+        raise VerificationError("Certificate url host must be s3.amazonaws.com: {0}".format(url))
+    if not posixpath.normpath(parsed.path).startswith("/echo.api/"):
+        raise VerificationError("Certificate url path must start with /echo.api/: {0}".format(url))
+    if parsed.port is not None and parsed.port != 443:
+        raise VerificationError("Certificate url port must be 443: {0}".format(url))
+
+
+def parse_timestamp(timestamp):
+    """
+    :param timestamp: request timestamp like 2016-04-13T23:03:14Z
+    :return: seconds since the epoch
+    """
+    return calendar.timegm(datetime.strptime(timestamp[:19], "%Y-%m-%dT%H:%M:%S").timetuple())
+
+
+class AlexaRequestVerifier(object):
+    """
+    Verifies the signature, signing certificate chain and timestamp of Alexa
+    requests.
+
+    verifier = AlexaRequestVerifier()
+    verifier.verify(headers, body, event)
+
+    :param fetcher: callable that returns the PEM certificate chain for a url,
+                    HTTPCertificateFetcher by default
+    :param trusted_roots: path of a PEM bundle with the trusted root certificates,
+                          by default the CA file of the ssl module
+    :param cache_size: number of certificate urls kept in the cache
+    :param cache_ttl: seconds a validated certificate is kept, it is never kept
+                      past the expiry of the certificate
+    :param max_timestamp_skew: seconds the request timestamp may differ from now
+    """
+
+    def __init__(self, fetcher=None, trusted_roots=None, cache_size=16, cache_ttl=3600,
+                 max_timestamp_skew=MAX_TIMESTAMP_SKEW, clock=time.time):
+        if x509 is None:
+            raise ImportError("AlexaRequestVerifier requires the cryptography package: pip install cryptography")
+
+        self.fetcher = fetcher if fetcher is not None else HTTPCertificateFetcher()
+        self.trusted_roots = trusted_roots if trusted_roots is not None else ssl.get_default_verify_paths().cafile
+        self.max_timestamp_skew = max_timestamp_skew
+        self.clock = clock
+        self._cache = LRUCache(cache_size, ttl=cache_ttl, clock=clock)
+        self._roots = None
+
+    def _root_certificates(self):
+        # subject -> certificates, loaded the first time a chain is validated
+        if self._roots is None:
+            if not self.trusted_roots:
+                raise VerificationError("No trusted root certificates configured")
+            with open(self.trusted_roots, 'rb') as f:
+                roots = {}
+                for cert in _load_pem_certificates(f.read()):
+                    roots.setdefault(cert.subject, []).append(cert)
+            self._roots = roots
+        return self._roots
+
+    def _validate_chain(self, chain, now):
+        if not chain:
+            raise VerificationError("Certificate chain is empty")
+
+        for cert in chain:
+            if not _cert_timestamp(cert, "not_valid_before") <= now <= _cert_timestamp(cert, "not_valid_after"):
+                raise VerificationError("Certificate is not valid now: {0}".format(cert.subject.rfc4514_string()))
+
+        signing_cert = chain[0]
+        try:
+            san = signing_cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        except x509.ExtensionNotFound:
+            raise VerificationError("Signing certificate has no subject alternative names")
+        if SIGNING_CERT_SAN not in san.get_values_for_type(x509.DNSName):
+            raise VerificationError("Signing certificate is not for {0}".format(SIGNING_CERT_SAN))
+
+        intermediates_below = 0
+        for cert, issuer in zip(chain, chain[1:]):
+            _check_can_issue(issuer, intermediates_below)
+            _verify_signed_by(cert, issuer)
+            if issuer.issuer != issuer.subject:
+                intermediates_below += 1
+
+        top = chain[-1]
+        for root in self._root_certificates().get(top.issuer, ()):
+            try:
+                # trust anchors are not required to carry CA extensions,
+                # but a path length they do carry still applies
+                _check_path_length(root, intermediates_below)
+                _verify_signed_by(top, root)
+                return
+            except VerificationError:
+                continue
+        raise VerificationError("Certificate chain does not lead to a trusted root: {0}".format(top.issuer.rfc4514_string()))
+
+    def _signing_key(self, cert_url, now):
+        public_key = self._cache.get(cert_url)
+        if public_key is None:
+            validate_cert_url(cert_url)
+            try:
+                chain = _load_pem_certificates(self.fetcher(cert_url))
+            except VerificationError:
+                raise
+            except Exception as exc:
+                raise VerificationError("Could not load certificate chain {0}: {1}".format(cert_url, exc))
+            self._validate_chain(chain, now)
+            public_key = chain[0].public_key()
+            if not isinstance(public_key, rsa.RSAPublicKey):
+                raise VerificationError("Signing certificate does not have an RSA key")
+            self._cache.put(cert_url, public_key, expires_at=_cert_timestamp(chain[0], "not_valid_after"))
+            logger.debug("validated signing certificate %s", cert_url)
+        return public_key
+
+    def verify(self, headers, body, event=None):
+        """
+        :param headers: request headers, any mapping with a get method
+        :param body: raw request body bytes, exactly as received
+        :param event: parsed body, if already available, otherwise the body is parsed
+        :return: True
+        :raise VerificationError: if the request is not valid
+        """
+        now = self.clock()
+
+        if event is None:
+            try:
+                event = json.loads(body.decode('utf-8'))
+            except ValueError:
+                raise VerificationError("Request body is not valid json")
+
+        try:
+            timestamp = parse_timestamp(event['request']['timestamp'])
+        except (KeyError, TypeError, ValueError):
+            raise VerificationError("Request has no valid timestamp")
+        if abs(now - timestamp) > self.max_timestamp_skew:
+            raise VerificationError("Request timestamp is too old or too far in the future")
+
+        cert_url = headers.get("SignatureCertChainUrl")
+        if not cert_url:
+            raise VerificationError("Missing SignatureCertChainUrl header")
+
+        signature = headers.get("Signature-256")
+        hash_algorithm = hashes.SHA256()
+        if not signature:
+            signature = headers.get("Signature")
+            hash_algorithm = hashes.SHA1()
+        if not signature:
+            raise VerificationError("Missing Signature header")
+
+        try:
+            signature = base64.b64decode(signature)
+        except (TypeError, ValueError):
+            raise VerificationError("Signature header is not valid base64")
+
+        public_key = self._signing_key(cert_url, now)
+        try:
+            public_key.verify(signature, body, padding.PKCS1v15(), hash_algorithm)
+        except InvalidSignature:
+            raise VerificationError("Invalid request signature")
+
+        return True
+
+    def is_valid(self, headers, body, event=None):
+        """
+        :return: True if the request is valid, False otherwise
+        """
+        try:
+            return self.verify(headers, body, event)
+        except VerificationError as exc:
+            logger.warning("request verification failed: %s", exc)
+            return False
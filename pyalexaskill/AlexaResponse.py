@@ -0,0 +1,172 @@
+import json
+
+"""
+Response builder that writes the final JSON bytes of an Alexa response directly.
+
+The constant parts of the responses are encoded once, when the module is
+imported, and only the variable values, like the speech text or the stream
+url, are encoded per response.  The *_json methods of the handlers and of
+AlexaUtils use these functions, and return bytes instead of the dict returned
+by the original methods.  Bytes can be written as is by a host like
+AlexaServer, so the response is not serialized a second time.
+"""
+
+
+def encode(obj):
+    """
+    :param obj: JSON serializable value
+    :return: compact JSON bytes
+    """
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def _encode_bool(value):
+    if value is True:
+        return b'true'
+    if value is False:
+        return b'false'
+    return encode(value)
+
+
+# --------------- pre-encoded fragments -----------------------
+VERSION = b'"version":"1.0"'
+
+STOP_RESPONSE = encode({
+    "version": "1.0",
+    "sessionAttributes": {},
+    "response": {
+        "directives": [
+            {
+                "type": "AudioPlayer.Stop"
+            }
+        ],
+        "shouldEndSession": True
+    }
+})
+
+CLEAR_QUEUE_RESPONSE = encode({
+    "version": "1.0",
+    "sessionAttributes": {},
+    "response": {
+        "directives": [
+            {
+                "type": "AudioPlayer.ClearQueue"
+            }
+        ],
+        "shouldEndSession": True
+    }
+})
+
+EMPTY_RESPONSE = encode({
+    "version": "1.0",
+    "sessionAttributes": {},
+    "response": {
+        "outputSpeech": {},
+        "card": {},
+        "reprompt": {},
+        "shouldEndSession": True
+    }
+})
+
+_RESPONSE_START = b'{' + VERSION + b',"sessionAttributes":'
+_RESPONSE_BODY = b',"response":'
+_EMPTY_SESSION_ATTRIBUTES = b'{}'
+
+_SPEECH_START = b'{"outputSpeech":{"type":"PlainText","text":'
+_REPROMPT_START = b'},"reprompt":{"outputSpeech":{"type":"PlainText","text":'
+_SHOULD_END_SESSION = b'}},"shouldEndSession":'
+_CARD_TITLE = b',"card":{"type":"Simple","title":'
+_CARD_CONTENT = b',"content":'
+
+_PLAY_START = b'"directives":[{"type":"AudioPlayer.Play","playBehavior":'
+_STREAM_TOKEN = b',"audioItem":{"stream":{"token":'
+_STREAM_PREVIOUS_TOKEN = b',"expectedPreviousToken":'
+_STREAM_URL = b',"url":'
+_STREAM_OFFSET = b',"offsetInMilliseconds":'
+_PLAY_END = b'}}}],"shouldEndSession":true}'
+_ENQUEUE_BEHAVIOR = encode("ENQUEUE")
+
+
+def response(session_attributes, speechlet_response):
+    """
+    Bytes version of _build_response
+    :param session_attributes: dict, or None for no attributes
+    :param speechlet_response: dict, or bytes from speechlet_response()
+    :return: JSON bytes
+    """
+    if not isinstance(speechlet_response, bytes):
+        speechlet_response = encode(speechlet_response)
+
+    return b''.join((
+        _RESPONSE_START,
+        encode(session_attributes) if session_attributes else _EMPTY_SESSION_ATTRIBUTES,
+        _RESPONSE_BODY,
+        speechlet_response,
+        b'}'
+    ))
+
+
+def speechlet_response(card_title, card_output, speech_output, reprompt_text, should_end_session):
+    """
+    Bytes version of _build_speechlet_response
+    :return: JSON bytes of the speechlet, to pass to response()
+    """
+    parts = [
+        _SPEECH_START, encode(speech_output),
+        _REPROMPT_START, encode(reprompt_text),
+        _SHOULD_END_SESSION, _encode_bool(should_end_session)
+    ]
+    if card_output and card_title:
+        parts.extend((_CARD_TITLE, encode(card_title), _CARD_CONTENT, encode(card_output), b'}'))
+    parts.append(b'}')
+    return b''.join(parts)
+
+
+def play_directive(token, url, behavior="REPLACE_ALL", offset=0, speech_content=None, card_title=None,
+                   card_content=None, session_attributes=None):
+    """
+    Bytes version of AlexaAudioBaseHandler.create_play_directive
+    :return: JSON bytes
+    """
+    if speech_content is not None:
+        output_speech = b'{"type":"PlainText","text":' + encode(speech_content) + b'}'
+    else:
+        output_speech = b'{}'
+
+    if card_content is not None:
+        card = b'{"type":"Simple","title":' + encode(card_title) + _CARD_CONTENT + encode(card_content) + b'}'
+    else:
+        card = b'{}'
+
+    return b''.join((
+        _RESPONSE_START,
+        encode(session_attributes) if session_attributes else _EMPTY_SESSION_ATTRIBUTES,
+        b',"response":{"outputSpeech":', output_speech,
+        b',"card":', card,
+        b',"reprompt":{},',
+        _PLAY_START, encode(behavior),
+        _STREAM_TOKEN, encode(token),
+        _STREAM_URL, encode(url),
+        _STREAM_OFFSET, encode(offset),
+        _PLAY_END,
+        b'}'
+    ))
+
+
+def enqueue_directive(current_token, token, url, session_attributes=None):
+    """
+    Bytes version of AlexaAudioBaseHandler.create_enqueue_directive
+    :return: JSON bytes
+    """
+    return b''.join((
+        _RESPONSE_START,
+        encode(session_attributes) if session_attributes else _EMPTY_SESSION_ATTRIBUTES,
+        b',"response":{',
+        _PLAY_START, _ENQUEUE_BEHAVIOR,
+        _STREAM_TOKEN, encode(token),
+        _STREAM_PREVIOUS_TOKEN, encode(current_token),
+        _STREAM_URL, encode(url),
+        _STREAM_OFFSET, b'0',
+        _PLAY_END,
+        b'}'
+    ))
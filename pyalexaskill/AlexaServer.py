@@ -0,0 +1,319 @@
+import importlib
+import json
+import logging
+import os
+import signal
+import ssl
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+"""
+HTTP(S) host to run an AlexaBaseHandler outside of AWS Lambda.
+
+The parent process binds the listening socket and then forks one worker
+process per core.  Each worker creates its own handler instance, so handlers
+can keep caches and connections just like in a warm lambda container, and
+serves Alexa POST requests on the shared socket with HTTP/1.1 keep-alive
+connections.  Idle keep-alive connections are closed after keepalive_timeout
+seconds, so they do not hold on to the connection slots of a worker.
+
+Requires python 3 and a platform with os.fork.
+"""
+
+logger = logging.getLogger("pyalexaskill.server")
+
+# response body for requests, e.g. AudioPlayer events, whose on_ handler returned None
+EMPTY_RESPONSE = b'{"version":"1.0","response":{}}'
+
+# a worker that exits within this many seconds of being started counts as a
+# failed start.  Failed starts are restarted with an exponential backoff of at
+# most WORKER_MAX_BACKOFF seconds, and serve gives up after WORKER_MAX_FAILED_STARTS
+# failed starts in a row, e.g. when the handler fails in warm_up.
+WORKER_MIN_UPTIME = 10.0
+WORKER_MAX_BACKOFF = 30.0
+WORKER_MAX_FAILED_STARTS = 5
+
+
+def load_handler_class(handler_path):
+    """
+    Import a handler class from a dotted path like mypackage.handlers.MyHandler
+    or mypackage.handlers:MyHandler
+    :param handler_path:
+    :return: handler class
+    """
+    if ":" in handler_path:
+        module_name, class_name = handler_path.split(":", 1)
+    else:
+        module_name, _, class_name = handler_path.rpartition(".")
+    if not module_name:
+        raise ValueError("Handler must be of the form module.ClassName: {0}".format(handler_path))
+
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class AlexaRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves Alexa POST requests by passing the JSON body to process_request of
+    the handler of the worker process.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # socket timeout while a request is read and answered
+        self.timeout = self.server.request_timeout
+        BaseHTTPRequestHandler.setup(self)
+
+    def handle_one_request(self):
+        # waiting for the next request of a connection uses the shorter
+        # keepalive_timeout, parse_request restores request_timeout
+        if self.server.keepalive_timeout is not None:
+            self.connection.settimeout(self.server.keepalive_timeout)
+        BaseHTTPRequestHandler.handle_one_request(self)
+
+    def parse_request(self):
+        self.connection.settimeout(self.timeout)
+        return BaseHTTPRequestHandler.parse_request(self)
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_error(400, b'{"error":"invalid content length"}')
+            return
+        if length > self.server.max_body_size:
+            self._send_error(413, b'{"error":"request too large"}')
+            return
+        body = self.rfile.read(length)
+
+        try:
+            event = json.loads(body.decode('utf-8'))
+        except ValueError:
+            self._send(400, b'{"error":"invalid json"}')
+            return
+
+        if not self.server.verify_request_body(self.headers, body, event):
+            self._send(400, b'{"error":"request verification failed"}')
+            return
+
+        response = self.server.alexa_handler.process_request(event, None)
+        if response is None:
+            payload = EMPTY_RESPONSE
+        elif isinstance(response, bytes):
+            # already encoded by one of the *_json response builders
+            payload = response
+        else:
+            payload = json.dumps(response, separators=(',', ':')).encode('utf-8')
+        self._send(200, payload)
+
+    def _send(self, status, payload):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_error(self, status, payload):
+        # the body was not read, so the connection cannot be reused
+        self.close_connection = True
+        self._send(status, payload)
+
+    def log_message(self, format, *args):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class AlexaHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded HTTP server for one worker process.  At most max_concurrent
+    connections are served at the same time, connections beyond that are
+    answered with 503, or closed over HTTPS, instead of queueing without
+    bound.  The listen backlog of the socket is bounded by request_queue_size.
+
+    With an ssl_context, connections are accepted as plain sockets and the TLS
+    handshake is done in the connection thread, so a slow client does not hold
+    up the accept loop.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    # seconds a request may take to be read and answered
+    request_timeout = 30.0
+    # seconds a keep-alive connection may wait for its next request
+    keepalive_timeout = 5.0
+    # seconds the TLS handshake of a connection may take
+    handshake_timeout = 10.0
+    # largest request body accepted, Alexa requests are a few kilobytes
+    max_body_size = 256 * 1024
+
+    def __init__(self, server_address, request_queue_size=128, max_concurrent=64, verifier=None, ssl_context=None):
+        self.request_queue_size = request_queue_size
+        self.alexa_handler = None
+        self.verifier = verifier
+        self.ssl_context = ssl_context
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        HTTPServer.__init__(self, server_address, AlexaRequestHandler)
+
+    def verify_request_body(self, headers, body, event):
+        """
+        Hook to verify a request before it is processed.  Uses the verifier,
+        e.g. an AlexaRequestVerifier, if the server has one.
+        :return: True if the request can be processed
+        """
+        if self.verifier is None:
+            return True
+        return self.verifier.is_valid(headers, body, event)
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(False):
+            try:
+                # the TLS handshake happens in the worker thread, so an HTTPS
+                # client is only refused, a plain text 503 would be a protocol error
+                if self.ssl_context is None:
+                    request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            finally:
+                self.shutdown_request(request)
+            return
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            ThreadingMixIn.process_request_thread(self, request, client_address)
+        finally:
+            self._slots.release()
+
+    def finish_request(self, request, client_address):
+        if self.ssl_context is None:
+            HTTPServer.finish_request(self, request, client_address)
+            return
+
+        request.settimeout(self.handshake_timeout)
+        try:
+            connection = self.ssl_context.wrap_socket(request, server_side=True)
+        except (ssl.SSLError, OSError) as exc:
+            logger.debug("TLS handshake with %s failed: %s", client_address, exc)
+            return
+        try:
+            HTTPServer.finish_request(self, connection, client_address)
+        finally:
+            self.shutdown_request(connection)
+
+
+def _run_worker(server, handler_class, handler_args):
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server.alexa_handler = handler_class(*handler_args)
+    server.alexa_handler.warm_up()
+    logger.info("worker %s serving %s", os.getpid(), handler_class.__name__)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def serve(handler_class, host="0.0.0.0", port=8080, workers=None, handler_args=(),
+          request_queue_size=128, max_concurrent=64, certfile=None, keyfile=None,
+          verifier=None, server_class=AlexaHTTPServer):
+    """
+    Serve a handler class with pre-forked worker processes until the parent
+    process receives SIGINT or SIGTERM.  Workers that exit are restarted, with
+    a backoff when they exit right after being started, see WORKER_MIN_UPTIME.
+
+    :param handler_class: AlexaBaseHandler subclass
+    :param host:
+    :param port:
+    :param workers: number of worker processes, default is one per core
+    :param handler_args: arguments used to create the handler in each worker
+    :param request_queue_size: listen backlog of the shared socket
+    :param max_concurrent: connections served at the same time by each worker
+    :param certfile: certificate to serve HTTPS, plain HTTP if not supplied
+    :param keyfile: private key for certfile
+    :param verifier: AlexaRequestVerifier to check the signature and timestamp of
+                     every request, required for skills hosted outside of lambda
+    :param server_class: AlexaHTTPServer or a subclass
+    :return: None
+    :raises RuntimeError: if the workers keep failing right after being started
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    ssl_context = None
+    if certfile:
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(certfile, keyfile)
+
+    server = server_class((host, port), request_queue_size=request_queue_size, max_concurrent=max_concurrent,
+                          verifier=verifier, ssl_context=ssl_context)
+
+    children = {}
+
+    def _spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(server, handler_class, handler_args)
+            except SystemExit:
+                pass
+            except Exception:
+                logger.exception("worker %s failed", os.getpid())
+                code = 1
+            os._exit(code)
+        children[pid] = time.time()
+
+    # SIGTERM stops the parent the same way as ctrl-c
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    logger.info("serving %s on %s:%s with %s workers", handler_class.__name__, host, port, workers)
+    failed_starts = 0
+    try:
+        for _ in range(workers):
+            _spawn()
+
+        while children:
+            pid, status = os.wait()
+            started = children.pop(pid, None)
+            if started is None:
+                continue
+            if time.time() - started >= WORKER_MIN_UPTIME:
+                failed_starts = 0
+                logger.warning("worker %s exited with status %s, restarting", pid, status)
+            else:
+                failed_starts += 1
+                if failed_starts >= WORKER_MAX_FAILED_STARTS:
+                    logger.error("worker %s exited with status %s, %s workers failed right after starting, giving up",
+                                 pid, status, failed_starts)
+                    break
+                delay = min(WORKER_MAX_BACKOFF, 0.5 * 2 ** failed_starts)
+                logger.warning("worker %s exited with status %s right after starting, restarting in %s seconds",
+                               pid, status, delay)
+                time.sleep(delay)
+            _spawn()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        server.server_close()
+
+    if failed_starts >= WORKER_MAX_FAILED_STARTS:
+        raise RuntimeError("The workers failed {0} times in a row right after starting".format(failed_starts))
@@ -0,0 +1,210 @@
+import base64
+import json
+import logging
+import zlib
+
+"""
+Compact encoding of the session attributes that are sent back and forth with
+every turn of a conversation.
+
+The attributes, except the ones listed in plain_keys, are packed into one
+string under a reserved key.  Dicts with a known set of fields can be packed
+as lists of values using a schema, so the field names are not repeated in
+every turn, and the packed JSON is compressed when it is larger than
+compress_threshold.  Attributes packed with the schema are kept apart from the
+other attributes in the packed JSON, so a list value is never mistaken for a
+packed record.
+
+codec = SessionCodec(schema={'route': ('origin', 'destination', 'time')},
+                     plain_keys=('new_user',))
+packed = codec.encode(attributes)     # use as sessionAttributes of the response
+attributes = codec.decode(packed)     # from session.attributes of the request
+
+Every encode checks the size of the encoded attributes against a budget and
+logs a warning if it is exceeded.  The last result is kept in last_report, its
+raw_bytes, which needs the attributes serialized a second time, is only
+measured when the budget is exceeded or debug logging is on.
+"""
+
+logger = logging.getLogger("pyalexaskill.session")
+
+# alexa rejects responses larger than 24 kilobytes
+DEFAULT_BUDGET = 24 * 1024
+
+_JSON_PREFIX = "j:"
+_ZLIB_PREFIX = "z:"
+
+_NOT_PACKED = object()
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+class SessionSizeReport(object):
+    __slots__ = ('raw_bytes', 'encoded_bytes', 'budget')
+
+    def __init__(self, raw_bytes, encoded_bytes, budget):
+        # raw_bytes is None when it was not measured
+        self.raw_bytes = raw_bytes
+        self.encoded_bytes = encoded_bytes
+        self.budget = budget
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.encoded_bytes > self.budget
+
+    def __repr__(self):
+        return "SessionSizeReport(raw_bytes={0}, encoded_bytes={1}, budget={2})".format(
+            self.raw_bytes, self.encoded_bytes, self.budget)
+
+
+class SessionCodec(object):
+    """
+    :param reserved_key: session attribute that holds the packed attributes
+    :param schema: dict of attribute name -> tuple of field names for dict values,
+                   or [tuple of field names] for lists of dicts
+    :param plain_keys: attributes that are not packed, e.g. small flags other tools read
+    :param compress_threshold: packed JSON larger than this many bytes is compressed
+    :param compress_level: zlib compression level
+    :param budget: size in bytes of the encoded attributes that logs a warning, None for no budget
+    """
+
+    def __init__(self, reserved_key="_packed", schema=None, plain_keys=(), compress_threshold=256,
+                 compress_level=6, budget=DEFAULT_BUDGET):
+        self.reserved_key = reserved_key
+        self.schema = schema or {}
+        self.plain_keys = frozenset(plain_keys)
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.budget = budget
+        self.last_report = None
+
+    # --------------- schema packing ----------------------
+    def _pack_value(self, name, value):
+        """
+        :return: the value packed with the schema, or _NOT_PACKED
+        """
+        fields = self.schema.get(name)
+        if fields is None:
+            return _NOT_PACKED
+        if isinstance(fields, list):
+            if not isinstance(value, list):
+                return _NOT_PACKED
+            records = [self._pack_record(fields[0], item) for item in value]
+            return _NOT_PACKED if _NOT_PACKED in records else records
+        return self._pack_record(fields, value)
+
+    @staticmethod
+    def _pack_record(fields, value):
+        # only dicts with exactly the schema fields are packed, anything else is kept as is
+        if isinstance(value, dict) and len(value) == len(fields) and all(field in value for field in fields):
+            return [value[field] for field in fields]
+        return _NOT_PACKED
+
+    def _unpack_value(self, name, value):
+        fields = self.schema.get(name)
+        if fields is None:
+            raise ValueError("No schema for the packed attribute {0}".format(name))
+        if isinstance(fields, list):
+            return [self._unpack_record(fields[0], item) for item in value]
+        return self._unpack_record(fields, value)
+
+    @staticmethod
+    def _unpack_record(fields, value):
+        if len(value) != len(fields):
+            raise ValueError("Packed record does not match the schema fields {0}".format(fields))
+        return dict(zip(fields, value))
+
+    # --------------- encoding ----------------------
+    def pack(self, attributes):
+        """
+        :param attributes: dict of the attributes to pack
+        :return: packed string
+        """
+        values = {}
+        records = {}
+        for name, value in attributes.items():
+            packed = self._pack_value(name, value)
+            if packed is _NOT_PACKED:
+                values[name] = value
+            else:
+                records[name] = packed
+        packed = _dumps([values, records] if records else [values])
+        if len(packed) > self.compress_threshold:
+            compressed = zlib.compress(packed.encode('utf-8'), self.compress_level)
+            return _ZLIB_PREFIX + base64.b64encode(compressed).decode('ascii')
+        return _JSON_PREFIX + packed
+
+    def unpack(self, packed):
+        """
+        :param packed: string from pack
+        :return: dict of the attributes
+        """
+        if packed.startswith(_ZLIB_PREFIX):
+            data = zlib.decompress(base64.b64decode(packed[len(_ZLIB_PREFIX):])).decode('utf-8')
+        elif packed.startswith(_JSON_PREFIX):
+            data = packed[len(_JSON_PREFIX):]
+        else:
+            raise ValueError("Unknown session attribute encoding")
+        parts = json.loads(data)
+        if not isinstance(parts, list) or not 1 <= len(parts) <= 2:
+            raise ValueError("Unknown session attribute encoding")
+        attributes = parts[0]
+        if len(parts) == 2:
+            for name, value in parts[1].items():
+                attributes[name] = self._unpack_value(name, value)
+        return attributes
+
+    def encode(self, attributes):
+        """
+        :param attributes: session attributes
+        :return: session attributes to send in the response
+        """
+        if not attributes:
+            return attributes
+
+        encoded = {}
+        to_pack = {}
+        for name, value in attributes.items():
+            if name in self.plain_keys:
+                encoded[name] = value
+            else:
+                to_pack[name] = value
+        if to_pack:
+            encoded[self.reserved_key] = self.pack(to_pack)
+
+        report = SessionSizeReport(None, len(_dumps(encoded)), self.budget)
+        if report.over_budget or logger.isEnabledFor(logging.DEBUG):
+            report.raw_bytes = len(_dumps(attributes))
+            if report.over_budget:
+                logger.warning("session attributes are %s bytes, over the budget of %s bytes (%s bytes unpacked)",
+                               report.encoded_bytes, self.budget, report.raw_bytes)
+            else:
+                logger.debug("%s", report)
+        self.last_report = report
+        return encoded
+
+    def decode(self, attributes):
+        """
+        :param attributes: session attributes from the request, packed or not
+        :return: new dict with the unpacked session attributes
+        """
+        if not attributes:
+            return {}
+
+        decoded = dict(attributes)
+        packed = decoded.pop(self.reserved_key, None)
+        if packed is not None:
+            decoded.update(self.unpack(packed))
+        return decoded
+
+    def size_report(self, attributes, encoded=None):
+        """
+        :param attributes: session attributes
+        :param encoded: result of encode(attributes), encoded if not supplied
+        :return: SessionSizeReport
+        """
+        if encoded is None:
+            encoded = self.encode(attributes)
+        return SessionSizeReport(len(_dumps(attributes)), len(_dumps(encoded)), self.budget)
@@ -0,0 +1,108 @@
+from pyalexaskill.AlexaPath import compile_path
+
+"""
+Copy-on-write overlay over the session attributes of a request.
+
+Reads go straight to the attributes of the incoming event, nothing is copied.
+A write copies only the dicts and lists along the path that is written, the
+first time each of them is changed, so the incoming event is never modified
+and large, mostly unchanged session states are not deep copied.
+
+overlay = SessionOverlay(event['session'].get('attributes'))
+overlay.get('app_context.stations.origin')
+overlay.set('app_context.stations.origin', origin)
+overlay.attributes   # the original object if nothing was written
+"""
+
+_MISSING = object()
+
+
+class SessionOverlay(object):
+    __slots__ = ('original', '_root', '_owned')
+
+    def __init__(self, original):
+        self.original = original if original is not None else {}
+        self._root = self.original
+        # id -> container copied by this overlay, safe to change in place
+        self._owned = {}
+
+    @property
+    def dirty(self):
+        return bool(self._owned)
+
+    @property
+    def attributes(self):
+        """
+        :return: the session attributes for the response, the original object
+                 when nothing was written, otherwise the copied root
+        """
+        return self._root
+
+    def get(self, path, default=None):
+        """
+        :param path: dotted path, e.g. 'app_context.stations.origin'
+        :return: value at the path or default
+        """
+        return compile_path(path).get(self._root, default)
+
+    def set(self, path, value):
+        """
+        Set the value at the path, copying the containers along the path that
+        still belong to the original attributes
+        """
+        compiled = compile_path(path)
+        node = self.own_root()
+        for segment in compiled.segments[:-1]:
+            node = self._own_child(node, segment)
+        _set(node, compiled.segments[-1], value)
+
+    def setdefault(self, path, default):
+        value = compile_path(path).get(self._root, _MISSING)
+        if value is _MISSING:
+            self.set(path, default)
+            value = default
+        return value
+
+    def own_root(self):
+        """
+        Make sure the root dict is a copy owned by the overlay, e.g. before
+        handing it out to code that changes it directly
+        :return: root dict
+        """
+        root = self._root
+        if id(root) not in self._owned:
+            root = self._root = self._copy(root)
+        return root
+
+    def _copy(self, container):
+        container = list(container) if isinstance(container, list) else dict(container)
+        self._owned[id(container)] = container
+        return container
+
+    def _own_child(self, node, segment):
+        child = _get(node, segment)
+        if isinstance(child, (dict, list)):
+            if id(child) in self._owned:
+                return child
+            child = self._copy(child)
+        else:
+            child = self._copy({})
+        _set(node, segment, child)
+        return child
+
+
+def _get(node, segment):
+    if isinstance(node, list):
+        if segment.isdigit() and int(segment) < len(node):
+            return node[int(segment)]
+        return None
+    return node.get(segment)
+
+
+def _set(node, segment, value):
+    if isinstance(node, list) and segment.isdigit() and int(segment) < len(node):
+        node[int(segment)] = value
+    elif isinstance(node, dict):
+        node[segment] = value
+    else:
+        raise TypeError("Cannot set {0!r} on a {1}".format(segment, type(node).__name__))
@@ -0,0 +1,260 @@
+import csv
+import io
+import json
+import logging
+import re
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+"""
+Resolves free form slot values onto a catalog of known entries, for example
+the stations of a train schedule skill.
+
+A slot value is resolved, in order, by:
+
+1. the entity resolution that Alexa sends in resolutions.resolutionsPerAuthority
+2. an exact match on the name or one of the synonyms of a catalog entry
+3. a prefix match, using a trie of the names and synonyms
+4. fuzzy scoring against every catalog entry, vectorized with numpy
+
+The index for 2. to 4. is built once, when the resolver is created, so create
+the resolver at module level or in on_cold_start and reuse it.
+
+Fuzzy matching requires numpy, without numpy only 1. to 3. are used.
+"""
+
+logger = logging.getLogger("pyalexaskill.resolver")
+
+_NORMALIZE_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_SPACES_RE = re.compile(r"\s+", re.UNICODE)
+
+_TERMINAL = ''
+
+
+def normalize(value):
+    """
+    Lower case the value, remove punctuation and collapse white space
+    """
+    value = _NORMALIZE_RE.sub(" ", value.lower())
+    return _SPACES_RE.sub(" ", value).strip()
+
+
+class SlotMatch(object):
+    """
+    Result of resolving a slot value.
+
+    source is one of 'authority', 'exact', 'prefix' or 'fuzzy', score is 1.0
+    for authority and exact matches.
+    """
+    __slots__ = ('id', 'name', 'score', 'source')
+
+    def __init__(self, id, name, score, source):
+        self.id = id
+        self.name = name
+        self.score = score
+        self.source = source
+
+    def __repr__(self):
+        return "SlotMatch(id={0!r}, name={1!r}, score={2:.3f}, source={3!r})".format(self.id, self.name, self.score, self.source)
+
+
+class SlotResolver(object):
+    """
+    :param entries: iterable of (id, name, synonyms) tuples
+    :param min_prefix: shortest value that is matched as a prefix
+    :param min_fuzzy_score: lowest cosine similarity accepted for a fuzzy match
+    :param fuzzy_dimensions: size of the hashed character bigram vectors used
+                             for fuzzy matching, memory use is
+                             4 * entries * fuzzy_dimensions bytes
+    """
+
+    def __init__(self, entries, min_prefix=3, min_fuzzy_score=0.6, fuzzy_dimensions=256):
+        self.min_prefix = min_prefix
+        self.min_fuzzy_score = min_fuzzy_score
+        self.fuzzy_dimensions = fuzzy_dimensions
+
+        self.ids = []
+        self.names = []
+        self._index = {}        # normalized name or synonym -> entry position
+        self._trie = {}
+        self._fuzzy_keys = []   # normalized names and synonyms, for the fuzzy matrix
+        self._fuzzy_entries = []
+
+        for entry_id, name, synonyms in entries:
+            position = len(self.ids)
+            self.ids.append(entry_id)
+            self.names.append(name)
+            for key in [name] + list(synonyms or ()):
+                key = normalize(key)
+                if not key or key in self._index:
+                    continue
+                self._index[key] = position
+                self._add_to_trie(key, position)
+                self._fuzzy_keys.append(key)
+                self._fuzzy_entries.append(position)
+
+        self._fuzzy_matrix = None
+        if numpy is not None:
+            self._fuzzy_matrix = self._build_fuzzy_matrix(self._fuzzy_keys)
+            self._fuzzy_positions = numpy.array(self._fuzzy_entries, dtype=numpy.int64)
+        else:
+            logger.warning("numpy is not installed, fuzzy slot matching is disabled")
+
+    # --------------- loading ----------------------
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """
+        Build a resolver from a catalog file.
+
+        .json files are either a list of {"id": .., "name": .., "synonyms": [..]}
+        objects, or an Alexa custom slot type with a "values" list of
+        {"id": .., "name": {"value": .., "synonyms": [..]}} objects.
+
+        .csv files have one entry per row: id,name,synonym,synonym,...
+
+        :param path: catalog file
+        :return: SlotResolver
+        """
+        if path.lower().endswith(".json"):
+            with io.open(path, "r", encoding="utf-8") as f:
+                return cls(_json_entries(json.load(f)), **kwargs)
+
+        with io.open(path, "r", encoding="utf-8", newline="") as f:
+            return cls(((row[0], row[1], row[2:]) for row in csv.reader(f) if len(row) >= 2), **kwargs)
+
+    def _add_to_trie(self, key, position):
+        node = self._trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault(_TERMINAL, position)
+
+    def _bigram_columns(self, key):
+        # hashed character bigrams of the key, padded so word edges count too
+        padded = " {0} ".format(key).encode("utf-8")
+        dimensions = self.fuzzy_dimensions
+        return [zlib.crc32(padded[i:i + 2]) % dimensions for i in range(len(padded) - 1)]
+
+    def _build_fuzzy_matrix(self, keys):
+        # one L2 normalized row of bigram counts per key
+        rows = []
+        columns = []
+        for row, key in enumerate(keys):
+            key_columns = self._bigram_columns(key)
+            rows.extend([row] * len(key_columns))
+            columns.extend(key_columns)
+
+        matrix = numpy.zeros((len(keys), self.fuzzy_dimensions), dtype=numpy.float32)
+        numpy.add.at(matrix, (numpy.array(rows, dtype=numpy.int64), numpy.array(columns, dtype=numpy.int64)), 1.0)
+        norms = numpy.sqrt(numpy.einsum('ij,ij->i', matrix, matrix))
+        norms[norms == 0] = 1.0
+        matrix /= norms[:, None]
+        return matrix
+
+    def _vector(self, key):
+        return self._build_fuzzy_matrix([key])[0]
+
+    def _match(self, position, score, source):
+        return SlotMatch(self.ids[position], self.names[position], score, source)
+
+    # --------------- matching ----------------------
+    def match_authority(self, resolutions):
+        """
+        :param resolutions: resolutionsPerAuthority list of a slot
+        :return: SlotMatch for the first successful resolution, or None
+        """
+        for authority in resolutions or ():
+            try:
+                if authority['status']['code'] != "ER_SUCCESS_MATCH":
+                    continue
+                value = authority['values'][0]['value']
+            except (KeyError, IndexError, TypeError):
+                continue
+            position = self._index.get(normalize(value.get('name', '')))
+            if position is not None:
+                return self._match(position, 1.0, 'authority')
+            return SlotMatch(value.get('id'), value.get('name'), 1.0, 'authority')
+        return None
+
+    def match_exact(self, value):
+        position = self._index.get(normalize(value))
+        if position is None:
+            return None
+        return self._match(position, 1.0, 'exact')
+
+    def match_prefix(self, value):
+        """
+        :return: SlotMatch for the shortest name or synonym starting with value, or None
+        """
+        key = normalize(value)
+        if len(key) < self.min_prefix:
+            return None
+
+        node = self._trie
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return None
+
+        # breadth first, so the shortest completion is found first
+        level = [node]
+        depth = 0
+        while level:
+            for candidate in level:
+                if _TERMINAL in candidate:
+                    return self._match(candidate[_TERMINAL], float(len(key)) / (len(key) + depth), 'prefix')
+            level = [child for candidate in level for char, child in candidate.items() if char != _TERMINAL]
+            depth += 1
+        return None
+
+    def match_fuzzy(self, value):
+        """
+        :return: SlotMatch with the highest similarity, if it is at least min_fuzzy_score, or None
+        """
+        if self._fuzzy_matrix is None or not len(self._fuzzy_matrix):
+            return None
+        key = normalize(value)
+        if not key:
+            return None
+
+        scores = self._fuzzy_matrix.dot(self._vector(key))
+        best = int(numpy.argmax(scores))
+        score = float(scores[best])
+        if score < self.min_fuzzy_score:
+            return None
+        return self._match(int(self._fuzzy_positions[best]), score, 'fuzzy')
+
+    def resolve(self, value, resolutions=None):
+        """
+        :param value: slot value spoken by the user
+        :param resolutions: optional resolutionsPerAuthority list of the slot
+        :return: SlotMatch or None
+        """
+        match = self.match_authority(resolutions)
+        if match is None and value:
+            match = self.match_exact(value) or self.match_prefix(value) or self.match_fuzzy(value)
+        return match
+
+    def resolve_slot(self, slot):
+        """
+        :param slot: AlexaEvent.Slot
+        :return: SlotMatch or None
+        """
+        if slot is None:
+            return None
+        return self.resolve(slot.value, slot.resolutions)
+
+
+def _json_entries(data):
+    if isinstance(data, dict):
+        data = data.get('values', [])
+    for item in data:
+        name = item.get('name')
+        if isinstance(name, dict):
+            # alexa custom slot type format
+            yield item.get('id') or name.get('value'), name.get('value'), name.get('synonyms', [])
+        else:
+            yield item.get('id') or name, name, item.get('synonyms', [])
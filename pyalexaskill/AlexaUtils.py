@@ -1,5 +1,14 @@
 import logging
-import dpath
+
+try:
+    import dpath.util
+except ImportError:
+    dpath = None
+
+from pyalexaskill import AlexaResponse
+from pyalexaskill.AlexaPath import compile_path
+from pyalexaskill.AlexaSessionOverlay import SessionOverlay
+from pyalexaskill.AlexaEvent import Event
 
 
 class AlexaUtils(object):
@@ -11,15 +20,20 @@ class AlexaUtils(object):
     https://developer.amazon.com/public/solutions/alexa/alexa-skills-kit/docs/handling-requests-sent-by-alexa
     """
 
-    def __init__(self, event, context, app_id=None, log_level=logging.INFO):
-        self.logger = logging.getLogger()
-        self.logger.setLevel(log_level)
+    def __init__(self, event, context, app_id=None, log_level=logging.INFO, session_codec=None):
+        self.logger = logging.getLogger("pyalexaskill")
+        if self.logger.level != log_level:
+            self.logger.setLevel(log_level)
         self.app_id = app_id
         self.event = event
+        # read-only view, each part of the event is parsed once when first used
+        self.view = Event(event)
         self.request = event['request']
         self.session = event['session'] if 'session' in event else None
         self.context = context
         self.session_attributes = None # copy of the event session attributes if they exist
+        self.session_codec = session_codec # optional AlexaSessionCodec.SessionCodec
+        self._session_overlay = None # copy-on-write overlay over the event session attributes
 
     def check_app_id(self):
         """
@@ -27,16 +41,11 @@ class AlexaUtils(object):
         :param event:
         :return: True - app id is valid, False - app id is invalid
         """
-        event = self.event
-        try:
-            if self.app_id and event['session']['application']['applicationId'] != self.app_id:
-                valid_app_id = False
-            else:
-                valid_app_id = True
-        except:
-            valid_app_id = False
+        if not self.app_id:
+            return True
 
-        return valid_app_id
+        session = self.view.session
+        return session is not None and session.application_id == self.app_id
 
     def _build_speechlet_response(self, card_title, card_output, speech_output, reprompt_text, should_end_session):
         """
@@ -78,7 +87,7 @@ class AlexaUtils(object):
         speech_output = params['speech_output']
         reprompt_text = params['reprompt_text']
         should_end_session = params['should_end_session']
-        session_attributes = self.get_session_attributes()
+        session_attributes = self._encoded_session_attributes()
 
         speechlet = self._build_speechlet_response(card_title,
                                                    card_output,
@@ -92,32 +101,36 @@ class AlexaUtils(object):
             'response': speechlet
         }
 
+    def build_response_json(self, params):
+        """
+        Same as build_response but returns the JSON bytes of the response
+        :param params: same as build_response
+        :return: JSON bytes
+        """
+        speechlet = AlexaResponse.speechlet_response(params['card_title'],
+                                                     params['card_output'],
+                                                     params['speech_output'],
+                                                     params['reprompt_text'],
+                                                     params['should_end_session'])
+
+        return AlexaResponse.response(self._encoded_session_attributes(), speechlet)
+
     def is_intent(self, intent_name):
         return self.get_intent_name() == intent_name
 
     def get_intent(self):
-        if 'intent' in self.request:
-            return self.request['intent']
-        else:
-            return None
+        intent = self.view.request.intent
+        return intent.raw if intent is not None else None
 
     def get_intent_name(self, default=None):
-        intent = self.get_intent()
-        if intent is not None and 'name' in intent:
-            intent_name = intent['name']
-        else:
-            intent_name = default
-
-        return intent_name
+        intent_name = self.view.request.intent_name
+        return intent_name if intent_name is not None else default
 
     def slot_exists(self, slot_name):
-        intent = self.get_intent()
-        if intent is not None and 'slots' in intent:
-            # alexa will send slots with a name but no 'value' element
-            # so check that both are there.
-            return slot_name in intent['slots'] and 'value' in intent['slots'][slot_name]
-        else:
-            return False
+        intent = self.view.request.intent
+        # alexa will send slots with a name but no 'value' element
+        # so check that both are there.
+        return intent is not None and intent.slot_exists(slot_name)
 
     def get_slot_value(self, slot_name):
         """
@@ -125,17 +138,21 @@ class AlexaUtils(object):
         :param slot_name:  name of the slot
         :return: value of the slot name, or None if there is not slot name
         """
-        value = None
-        try:
-            if self.slot_exists(slot_name):
-                intent = self.get_intent()
-                value = intent['slots'][slot_name]['value']
-            else:
-                value = None
-        except Exception as exc:
-            self.logger.error("Error getting slot value for slot_name={0}".format(slot_name))
+        intent = self.view.request.intent
+        return intent.slot_value(slot_name) if intent is not None else None
 
-        return value
+    def resolve_slot(self, slot_name, resolver):
+        """
+        Resolve the value of a slot onto a catalog, see AlexaSlotResolver
+
+        :param slot_name:  name of the slot
+        :param resolver: SlotResolver
+        :return: SlotMatch or None
+        """
+        intent = self.view.request.intent
+        if intent is None:
+            return None
+        return resolver.resolve_slot(intent.get_slot(slot_name))
 
     def get_request_type(self):
         """
@@ -143,21 +160,45 @@ class AlexaUtils(object):
         :return:  Alexa request type.
         """
         if self.request:
-            return self.request['type']
+            return self.view.request.type
 
     def get_session_attributes(self):
         """
-        create a copy of all of the session.attributes and return to the caller
+        create a copy of all of the session.attributes and return to the caller.
+        Only the top level dict is copied, prefer get_session_attribute and
+        set_session_attribute which never change the incoming event.
         :return: session.attributes
         """
         if self.session_attributes is None:
-            if self.session and \
+            self.session_attributes = self.get_session_overlay().own_root()
+
+        return self.session_attributes
+
+    def get_session_overlay(self):
+        """
+        Copy-on-write overlay over session.attributes, see AlexaSessionOverlay.
+        If there is a session_codec the attributes are unpacked here, the first
+        time they are used.
+        :return: SessionOverlay
+        """
+        if self._session_overlay is None:
+            if self.session_codec is not None:
+                original = self.session_codec.decode(self.session.get('attributes') if self.session else None)
+            elif self.session and \
                             'attributes' in self.session:
-                self.session_attributes = self.session['attributes'].copy()
+                original = self.session['attributes']
             else:
-                self.session_attributes = {}
+                original = {}
+            self._session_overlay = SessionOverlay(original)
 
-        return self.session_attributes
+        return self._session_overlay
+
+    def _encoded_session_attributes(self):
+        # unchanged attributes echo the original object of the event
+        session_attributes = self.get_session_overlay().attributes
+        if self.session_codec is not None:
+            return self.session_codec.encode(session_attributes)
+        return session_attributes
 
     def get_session_attribute(self, path, default=None):
         """
@@ -172,15 +213,14 @@ class AlexaUtils(object):
         :param default: if the value is not found, the default value to return.
         :return: the value in the session specified by the path or the default value.
         """
-        value = None
-        try:
-            value = dpath.util.get(self.get_session_attributes(), path, separator='.')
-        except:
-            if default is not None:
-                dpath.util.new(self.get_session_attributes(), path=path, separator='.', value=default )
-                value = default
+        compiled = compile_path(path)
+        if compiled.is_glob:
+            return self._get_session_attribute_glob(path, default)
 
-        return value
+        if default is not None:
+            return self.get_session_overlay().setdefault(path, default)
+
+        return self.get_session_overlay().get(path, None)
 
     def set_session_attribute(self, path, value):
         """
@@ -195,7 +235,32 @@ class AlexaUtils(object):
         :param value: value to save
         :return: None
         """
-        c = dpath.util.set(self.get_session_attributes(), path, separator='.', value=value )
+        compiled = compile_path(path)
+        if compiled.is_glob:
+            self._set_session_attribute_glob(path, value)
+        else:
+            self.get_session_overlay().set(path, value)
+
+    # glob paths, e.g. 'app_context.stations.*', still need dpath
+    def _require_dpath(self, path):
+        if dpath is None:
+            raise ValueError("Glob attribute paths require the dpath package: {0}".format(path))
+
+    def _get_session_attribute_glob(self, path, default):
+        self._require_dpath(path)
+        value = None
+        try:
+            value = dpath.util.get(self.get_session_attributes(), path, separator='.')
+        except:
+            if default is not None:
+                dpath.util.new(self.get_session_attributes(), path=path, separator='.', value=default)
+                value = default
+
+        return value
+
+    def _set_session_attribute_glob(self, path, value):
+        self._require_dpath(path)
+        c = dpath.util.set(self.get_session_attributes(), path, separator='.', value=value)
         if c == 0:
             # then this must be new because none were updated
             dpath.util.new(self.get_session_attributes(), path=path, separator='.', value=value)
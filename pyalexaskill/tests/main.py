@@ -15,11 +15,14 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-def lambda_handler(event, context):
-    logging.info("Executing main lambda_handler for AlexaDeploymentHandler class")
+# created once per lambda container and reused by warm invocations
+alexa = AlexaDeploymentHandler()
+alexa.warm_up()
+
 
-    alexa = AlexaDeploymentHandler()
+def lambda_handler(event, context):
     alexa_response = alexa.process_request(event, context)
+    logging.info("Executed main lambda_handler for AlexaDeploymentHandler class, cold start: %s", alexa.is_cold_start)
 
     return alexa_response
 
@@ -34,8 +34,12 @@ CLASSIFIERS = [
     "Topic :: Software Development :: Libraries :: Python Modules",
 ]
 INSTALL_REQUIRES = [
-    'dpath >= 1.4.0'
 ]
+EXTRAS_REQUIRE = {
+    'dpath': ['dpath >= 1.4.0'],
+    'verify': ['cryptography >= 3.1'],
+    'resolver': ['numpy'],
+}
 
 ###############################################################################
 
@@ -68,5 +72,6 @@ if __name__ == "__main__":
         zip_safe=False,
         classifiers=CLASSIFIERS,
         install_requires=INSTALL_REQUIRES,
-        scripts=['bin/create_aws_lambda.py','bin/create_aws_main.py', 'bin/create_alexa_handler.py', 'bin/create_alexa_test_skills.py','bin/create_alexa_audio_handler.py', 'bin/create_test_deployment.py']
+        extras_require=EXTRAS_REQUIRE,
+        scripts=['bin/create_aws_lambda.py','bin/create_aws_main.py', 'bin/create_alexa_handler.py', 'bin/create_alexa_test_skills.py','bin/create_alexa_audio_handler.py', 'bin/create_test_deployment.py', 'bin/run_alexa_server.py']
     )
\ No newline at end of file
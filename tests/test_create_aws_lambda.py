@@ -0,0 +1,93 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bin", "create_aws_lambda.py")
+_spec = importlib.util.spec_from_file_location("create_aws_lambda", _SCRIPT)
+create_aws_lambda = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(create_aws_lambda)
+
+
+class SlimDeploymentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, *rel_paths):
+        for rel_path in rel_paths:
+            path = os.path.join(self.directory, *rel_path.split("/"))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write("")
+
+    def exists(self, rel_path):
+        return os.path.exists(os.path.join(self.directory, *rel_path.split("/")))
+
+    def test_keeps_packages_named_like_data_directories(self):
+        self.write("botocore/__init__.py", "botocore/client.py",
+                   "botocore/docs/__init__.py", "botocore/docs/docstring.py",
+                   "pyalexaskill/__init__.py", "pyalexaskill/tests/main.py",
+                   "tests/test_main.py", "docs/index.rst",
+                   "six-1.0.dist-info/METADATA", "six-1.0.dist-info/RECORD")
+
+        removed = create_aws_lambda._slim_deployment(self.directory, create_aws_lambda.default_exclude_patterns)
+
+        self.assertEqual(sorted(removed), ["docs/index.rst", "six-1.0.dist-info/RECORD", "tests/test_main.py"])
+        self.assertTrue(self.exists("botocore/docs/docstring.py"))
+        self.assertTrue(self.exists("pyalexaskill/tests/main.py"))
+        self.assertFalse(self.exists("tests"))
+
+    def test_removes_cache_files_inside_packages(self):
+        self.write("botocore/__init__.py", "botocore/__pycache__/client.cpython-311.pyc")
+
+        removed = create_aws_lambda._slim_deployment(self.directory, create_aws_lambda.default_exclude_patterns)
+
+        self.assertEqual(removed, ["botocore/__pycache__/client.cpython-311.pyc"])
+        self.assertFalse(self.exists("botocore/__pycache__"))
+
+
+class CachedInstallTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.deployment_dir = os.path.join(self.directory, "deployment")
+        os.mkdir(self.deployment_dir)
+        self.saved = create_aws_lambda.cache_dir, create_aws_lambda._pip
+        create_aws_lambda.cache_dir = os.path.join(self.directory, "cache")
+
+    def tearDown(self):
+        create_aws_lambda.cache_dir, create_aws_lambda._pip = self.saved
+        shutil.rmtree(self.directory)
+
+    def cache_entries(self):
+        entries = []
+        for (dir_path, dir_names, file_names) in os.walk(create_aws_lambda.cache_dir):
+            entries.extend(os.path.relpath(os.path.join(dir_path, name), create_aws_lambda.cache_dir)
+                           for name in dir_names + file_names)
+        return sorted(entries)
+
+    def test_failed_pip_leaves_no_temporary_directories(self):
+        for failing in ("wheel", "install"):
+            def pip(args):
+                if args[0] == "wheel":
+                    with open(os.path.join(args[args.index("-w") + 1], "six-1.0-py3-none-any.whl"), 'w') as f:
+                        f.write("")
+                else:
+                    os.makedirs(args[args.index("-t") + 1])
+                if args[0] == failing:
+                    raise RuntimeError("pip failed")
+
+            create_aws_lambda._pip = pip
+            with self.assertRaises(RuntimeError):
+                create_aws_lambda._cached_install(["six>=1.0"], self.deployment_dir)
+            self.assertEqual([entry for entry in self.cache_entries() if entry not in ("installs", "wheels")], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+import base64
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+    from cryptography.x509.oid import NameOID
+except ImportError:
+    x509 = None
+
+from pyalexaskill.AlexaRequestVerifier import AlexaRequestVerifier, FileCertificateFetcher, VerificationError
+
+CERT_URL = "https://s3.amazonaws.com/echo.api/echo-api-cert.pem"
+NOW = 1700000000
+DAY = datetime.timedelta(days=1)
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _name(common_name):
+    return x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+
+
+def _key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def _cert(subject, subject_key, issuer, issuer_key, not_before, not_after, ca=False, san=None, path_length=None):
+    builder = (x509.CertificateBuilder()
+               .subject_name(_name(subject))
+               .issuer_name(_name(issuer))
+               .public_key(subject_key.public_key())
+               .serial_number(x509.random_serial_number())
+               .not_valid_before(not_before)
+               .not_valid_after(not_after)
+               .add_extension(x509.BasicConstraints(ca=ca, path_length=path_length), critical=True)
+               .add_extension(x509.KeyUsage(digital_signature=not ca, content_commitment=False, key_encipherment=False,
+                                            data_encipherment=False, key_agreement=False, key_cert_sign=ca,
+                                            crl_sign=ca, encipher_only=False, decipher_only=False), critical=True))
+    if san is not None:
+        builder = builder.add_extension(x509.SubjectAlternativeName([x509.DNSName(san)]), critical=False)
+    return builder.sign(issuer_key, hashes.SHA256())
+
+
+def _pem(*certs):
+    return b"".join(cert.public_bytes(serialization.Encoding.PEM) for cert in certs)
+
+
+@unittest.skipIf(x509 is None, "requires the cryptography package")
+class AlexaRequestVerifierTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        now = EPOCH + datetime.timedelta(seconds=NOW)
+        cls.root_key, cls.intermediate_key, cls.signing_key = _key(), _key(), _key()
+        cls.root = _cert("Test Root", cls.root_key, "Test Root", cls.root_key, now - 10 * DAY, now + 10 * DAY, ca=True)
+        cls.intermediate = _cert("Test Intermediate", cls.intermediate_key, "Test Root", cls.root_key,
+                                 now - 10 * DAY, now + 10 * DAY, ca=True)
+        cls.not_after = now + DAY
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.roots = os.path.join(self.directory, "roots.pem")
+        with open(self.roots, 'wb') as f:
+            f.write(_pem(self.root))
+        self.write_chain()
+        self.fetches = []
+        fetcher = FileCertificateFetcher(self.directory)
+
+        def counting_fetcher(url):
+            self.fetches.append(url)
+            return fetcher(url)
+
+        self.verifier = AlexaRequestVerifier(fetcher=counting_fetcher, trusted_roots=self.roots, clock=lambda: NOW)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_chain(self, san="echo-api.amazon.com", not_before=None, not_after=None, signing_key=None):
+        now = EPOCH + datetime.timedelta(seconds=NOW)
+        signing = _cert("echo-api.amazon.com", signing_key or self.signing_key, "Test Intermediate",
+                        self.intermediate_key, not_before or now - DAY, not_after or self.not_after, san=san)
+        self.write_certs(signing, self.intermediate)
+
+    def write_certs(self, *certs):
+        with open(os.path.join(self.directory, "echo-api-cert.pem"), 'wb') as f:
+            f.write(_pem(*certs))
+
+    def request(self, timestamp=NOW, key=None):
+        event = {"request": {"type": "LaunchRequest",
+                             "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))}}
+        body = json.dumps(event).encode('utf-8')
+        signature = (key or self.signing_key).sign(body, padding.PKCS1v15(), hashes.SHA256())
+        headers = {"SignatureCertChainUrl": CERT_URL, "Signature-256": base64.b64encode(signature).decode('ascii')}
+        return headers, body
+
+    def test_valid_request(self):
+        headers, body = self.request()
+        self.assertTrue(self.verifier.verify(headers, body))
+        self.assertTrue(self.verifier.is_valid(headers, body, json.loads(body.decode('utf-8'))))
+
+    def test_bad_signature(self):
+        headers, body = self.request(key=_key())
+        with self.assertRaisesRegex(VerificationError, "Invalid request signature"):
+            self.verifier.verify(headers, body)
+
+    def test_tampered_body(self):
+        headers, body = self.request()
+        self.assertFalse(self.verifier.is_valid(headers, body.replace(b"LaunchRequest", b"IntentRequest")))
+
+    def test_expired_certificate(self):
+        now = EPOCH + datetime.timedelta(seconds=NOW)
+        self.write_chain(not_before=now - 10 * DAY, not_after=now - DAY)
+        headers, body = self.request()
+        with self.assertRaisesRegex(VerificationError, "not valid now"):
+            self.verifier.verify(headers, body)
+
+    def test_wrong_san(self):
+        self.write_chain(san="example.com")
+        headers, body = self.request()
+        with self.assertRaisesRegex(VerificationError, "is not for echo-api.amazon.com"):
+            self.verifier.verify(headers, body)
+
+    def test_untrusted_root(self):
+        other_key = _key()
+        now = EPOCH + datetime.timedelta(seconds=NOW)
+        with open(self.roots, 'wb') as f:
+            f.write(_pem(_cert("Other Root", other_key, "Other Root", other_key, now - DAY, now + DAY, ca=True)))
+        headers, body = self.request()
+        with self.assertRaisesRegex(VerificationError, "trusted root"):
+            self.verifier.verify(headers, body)
+
+    def test_end_entity_issuer_is_rejected(self):
+        # a leaf for another domain chaining to the trusted root must not be able
+        # to sign an echo-api.amazon.com certificate
+        now = EPOCH + datetime.timedelta(seconds=NOW)
+        attacker_key = _key()
+        attacker = _cert("attacker.example", attacker_key, "Test Intermediate", self.intermediate_key,
+                         now - DAY, now + DAY, san="attacker.example")
+        forged = _cert("echo-api.amazon.com", self.signing_key, "attacker.example", attacker_key,
+                       now - DAY, now + DAY, san="echo-api.amazon.com")
+        self.write_certs(forged, attacker, self.intermediate)
+        headers, body = self.request()
+        with self.assertRaisesRegex(VerificationError, "not a CA certificate"):
+            self.verifier.verify(headers, body)
+
+    def test_path_length_constraint(self):
+        now = EPOCH + datetime.timedelta(seconds=NOW)
+        limited = _cert("Test Intermediate", self.intermediate_key, "Test Root", self.root_key,
+                        now - DAY, now + DAY, ca=True, path_length=0)
+        sub_key = _key()
+        sub = _cert("Test Sub", sub_key, "Test Intermediate", self.intermediate_key, now - DAY, now + DAY, ca=True)
+        signing = _cert("echo-api.amazon.com", self.signing_key, "Test Sub", sub_key,
+                        now - DAY, now + DAY, san="echo-api.amazon.com")
+        self.write_certs(signing, sub, limited)
+        headers, body = self.request()
+        with self.assertRaisesRegex(VerificationError, "path length"):
+            self.verifier.verify(headers, body)
+
+    def test_non_rsa_signing_key(self):
+        self.write_chain(signing_key=ec.generate_private_key(ec.SECP256R1()))
+        headers, body = self.request()
+        self.assertFalse(self.verifier.is_valid(headers, body))
+
+    def test_stale_timestamp(self):
+        headers, body = self.request(timestamp=NOW - 151)
+        with self.assertRaisesRegex(VerificationError, "timestamp"):
+            self.verifier.verify(headers, body)
+        self.assertEqual(self.fetches, [])
+
+    def test_invalid_cert_url(self):
+        headers, body = self.request()
+        headers["SignatureCertChainUrl"] = "https://example.com/echo.api/echo-api-cert.pem"
+        with self.assertRaisesRegex(VerificationError, "s3.amazonaws.com"):
+            self.verifier.verify(headers, body)
+        self.assertEqual(self.fetches, [])
+
+    def test_certificate_cache_hit(self):
+        for _ in range(3):
+            headers, body = self.request()
+            self.assertTrue(self.verifier.verify(headers, body))
+        self.assertEqual(self.fetches, [CERT_URL])
+
+    def test_failed_chain_is_not_cached(self):
+        self.write_chain(san="example.com")
+        headers, body = self.request()
+        self.assertFalse(self.verifier.is_valid(headers, body))
+        self.write_chain()
+        self.assertTrue(self.verifier.is_valid(headers, body))
+        self.assertEqual(self.fetches, [CERT_URL, CERT_URL])
+
+
+if __name__ == '__main__':
+    unittest.main()